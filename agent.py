@@ -2,6 +2,8 @@ import google.generativeai as genai
 from google.generativeai import types 
 import os
 import logging
+import stat
+import time
 from pathlib import Path
 import json
 
@@ -38,66 +40,169 @@ except Exception as e:
 
 
 # --- File Operation Tools (Python Functions) ---
-def _resolve_safe_path(relative_filepath: str) -> Path | None:
+# Resolved workspace root, cached per AGENT_FILES_WORKSPACE value so tool calls do not
+# re-resolve it (tests may point AGENT_FILES_WORKSPACE elsewhere, which refreshes it).
+_WORKSPACE_ROOT_CACHE = {"workspace": None, "root": None}
+
+def _workspace_root() -> str:
+    """Returns the resolved AGENT_FILES_WORKSPACE as a plain string, resolving it only when it changes."""
+    if _WORKSPACE_ROOT_CACHE["workspace"] != AGENT_FILES_WORKSPACE:
+        _WORKSPACE_ROOT_CACHE["root"] = os.path.realpath(AGENT_FILES_WORKSPACE, strict=True) # e.g., /app/agent_files
+        _WORKSPACE_ROOT_CACHE["workspace"] = AGENT_FILES_WORKSPACE
+    return _WORKSPACE_ROOT_CACHE["root"]
+
+# Uploads are streamed into '.upload-*.part' files in the workspace and renamed into place
+# once complete; these in-progress files are kept out of the listing and the name index.
+UPLOAD_TEMP_PREFIX = '.upload-'
+UPLOAD_TEMP_SUFFIX = '.part'
+
+def _is_upload_temp(name: str) -> bool:
+    """Returns True if name is an in-progress upload file rather than a workspace file."""
+    return name.startswith(UPLOAD_TEMP_PREFIX) and name.endswith(UPLOAD_TEMP_SUFFIX)
+
+# Upper bound on how far a directory mtime can lag behind the real modification time.
+_MTIME_GRANULARITY_NS = 50_000_000
+
+# Index of every file under the workspace, so simple-filename lookups are dict hits instead
+# of an rglob walk per call. Swapped in as one dict so concurrent readers never see half of it.
+_WORKSPACE_INDEX = {"index": None}
+
+def _build_workspace_index(base_path: str) -> dict:
+    """
+    Walks the workspace once and maps file names to (depth, path) candidates, shallowest first
+    and then by path, so ties between e.g. report.md and report.txt resolve the same way every time.
+    'by_name' holds exact names; 'by_prefix' holds every dotted prefix of a name, matching what
+    an rglob("stem.*") would have found. 'dir_mtimes' records each directory for revalidation.
+    """
+    built_at_ns = time.time_ns()
+    dir_mtimes, by_name, by_prefix = {base_path: os.stat(base_path).st_mtime_ns}, {}, {}
+    # Iterative scandir walk: DirEntry type checks come from readdir's d_type without a stat,
+    # and no per-entry Path objects or per-directory name lists are built. Symlinked directories
+    # are not walked; a symlinked file is indexed under its own name, pointing at its target,
+    # but only when that target is a regular file inside the workspace.
+    inside = base_path + os.sep
+    stack = [base_path]
+    while stack:
+        dirpath = stack.pop()
+        depth = dirpath.count(os.sep) + 1
+        with os.scandir(dirpath) as it:
+            for dir_entry in it:
+                if dir_entry.is_dir(follow_symlinks=False):
+                    stack.append(dir_entry.path)
+                    dir_mtimes[dir_entry.path] = dir_entry.stat(follow_symlinks=False).st_mtime_ns
+                    continue
+                name = dir_entry.name
+                if _is_upload_temp(name):
+                    continue
+                if dir_entry.is_file(follow_symlinks=False):
+                    path = dir_entry.path
+                elif dir_entry.is_symlink():
+                    path = os.path.realpath(dir_entry.path)
+                    if not (path.startswith(inside) and os.path.isfile(path)):
+                        continue
+                else:
+                    continue
+                entry = (depth, path)
+                by_name.setdefault(name, []).append(entry)
+                dot = name.find('.')
+                while dot > 0:
+                    by_prefix.setdefault(name[:dot], []).append(entry)
+                    dot = name.find('.', dot + 1)
+    for candidates in (*by_name.values(), *by_prefix.values()):
+        candidates.sort()
+    # As with the listing cache, a directory modified within the mtime granularity of this walk
+    # may change again without its mtime moving, so such an index is used once and not kept.
+    reusable = all(built_at_ns - mtime > _MTIME_GRANULARITY_NS for mtime in dir_mtimes.values())
+    return {"root": base_path, "dir_mtimes": dir_mtimes, "by_name": by_name,
+            "by_prefix": by_prefix, "reusable": reusable}
+
+def _workspace_index(base_path: str) -> dict:
+    """Returns the workspace name index, rebuilding it if any indexed directory has changed."""
+    index = _WORKSPACE_INDEX["index"]
+    if index is not None and index["root"] == base_path:
+        try:
+            if all(os.stat(d).st_mtime_ns == m for d, m in index["dir_mtimes"].items()):
+                return index
+        except OSError:
+            pass # An indexed directory disappeared; rebuild.
+    index = _build_workspace_index(base_path)
+    _WORKSPACE_INDEX["index"] = index if index["reusable"] else None
+    return index
+
+def _resolve_safe_path(relative_filepath: str) -> str | None:
     """
     Resolves a relative filepath to an absolute path within the AGENT_FILES_WORKSPACE.
     If relative_filepath is a simple filename, it searches for the file within
     AGENT_FILES_WORKSPACE and its subdirectories. If not found, it assumes
     the file is to be created in AGENT_FILES_WORKSPACE directly.
     Prevents path traversal by ensuring the resolved path is within the workspace.
+    Works on plain strings throughout; this runs on every tool call.
 
     Args:
         relative_filepath (str): The path relative to AGENT_FILES_WORKSPACE or a simple filename.
 
     Returns:
-        Path | None: The absolute Path object if safe and resolved, None otherwise.
+        str | None: The absolute path if safe and resolved, None otherwise.
     """
+    # Cheap rejections first: nothing to resolve, absolute paths, or paths that start by
+    # climbing out of the workspace can never end up inside it.
+    if not relative_filepath or relative_filepath == '.':
+        logging.warning(f"Empty or workspace-root path '{relative_filepath}' is not a valid file path.")
+        return None
+    if os.path.isabs(relative_filepath) or relative_filepath.replace('\\', '/').split('/', 1)[0] == '..':
+        logging.warning(f"Path traversal attempt or path outside workspace detected: '{relative_filepath}'.")
+        return None
+
     try:
-        base_path = AGENT_FILES_WORKSPACE.resolve(strict=True) # e.g., /app/agent_files
+        base_path = _workspace_root()
         final_resolved_path = None
 
         # Check if relative_filepath is a simple filename or a path
         if '/' in relative_filepath or '\\' in relative_filepath: # Treat as a path
-            logging.info(f"Resolving '{relative_filepath}' as a path.")
+            logging.info("Resolving '%s' as a path.", relative_filepath)
             # Resolve the combined path (e.g., /app/agent_files/user_provided/file.txt)
-            # strict=False allows checking paths that don't exist yet (for writing new files)
-            current_resolved_path = (base_path / relative_filepath).resolve(strict=False)
-            final_resolved_path = current_resolved_path
+            # realpath is non-strict, which allows checking paths that don't exist yet (for writing new files)
+            final_resolved_path = os.path.realpath(os.path.join(base_path, relative_filepath))
         else: # Treat as a simple filename
-            logging.info(f"Resolving '{relative_filepath}' as a simple filename.")
+            logging.info("Resolving '%s' as a simple filename.", relative_filepath)
             filename_has_extension = bool(os.path.splitext(relative_filepath)[1])
             
             if filename_has_extension:
-                logging.info(f"Filename '{relative_filepath}' has an extension. Performing exact search.")
+                logging.info("Filename '%s' has an extension. Performing exact search.", relative_filepath)
                 search_pattern = relative_filepath
             else:
-                logging.info(f"Filename '{relative_filepath}' does not have an extension. Performing extension-agnostic search (e.g., '{relative_filepath}.*').")
+                logging.info("Filename '%s' does not have an extension. Performing extension-agnostic search (e.g., '%s.*').", relative_filepath, relative_filepath)
                 search_pattern = f"{relative_filepath}.*"
 
-            found_files = list(base_path.rglob(search_pattern))
+            index = _workspace_index(base_path)
+            if filename_has_extension:
+                found_files = index["by_name"].get(relative_filepath, ())
+            else:
+                found_files = index["by_prefix"].get(relative_filepath, ())
 
             if found_files:
-                # Prioritize the file with the shallowest depth
-                found_files.sort(key=lambda p: len(p.relative_to(base_path).parts))
-                final_resolved_path = found_files[0]
+                # Candidates are pre-sorted: the file with the shallowest depth wins
+                final_resolved_path = found_files[0][1]
                 if len(found_files) > 1:
-                    logging.info(f"Found multiple files: {[str(f.relative_to(base_path)) for f in found_files]} for pattern '{search_pattern}'. Selected '{final_resolved_path.relative_to(base_path)}' based on depth/order.")
+                    # Building the candidate list is only worth it when the message will be emitted.
+                    if logging.getLogger().isEnabledFor(logging.INFO):
+                        logging.info("Found multiple files: %s for pattern '%s'. Selected '%s' based on depth/order.", [os.path.relpath(f, base_path) for _, f in found_files], search_pattern, os.path.relpath(final_resolved_path, base_path))
                 else:
-                    logging.info(f"Found '{relative_filepath}' (pattern: '{search_pattern}') at '{final_resolved_path}'.")
+                    logging.info("Found '%s' (pattern: '%s') at '%s'.", relative_filepath, search_pattern, final_resolved_path)
             else:
                 # File not found (neither exact nor with wildcard extension), 
                 # assume it's for writing a new file directly under AGENT_FILES_WORKSPACE
                 # using the original relative_filepath (which might or might not have an extension).
-                final_resolved_path = (base_path / relative_filepath).resolve(strict=False)
-                logging.info(f"File matching pattern '{search_pattern}' (from input '{relative_filepath}') not found. Assuming path for new file: '{final_resolved_path}'.")
+                # A bare filename joined to the already-resolved base is normalized by construction,
+                # so only a symlink at that location needs the full resolve.
+                final_resolved_path = os.path.join(base_path, relative_filepath)
+                if os.path.islink(final_resolved_path):
+                    final_resolved_path = os.path.realpath(final_resolved_path)
+                logging.info("File matching pattern '%s' (from input '%s') not found. Assuming path for new file: '%s'.", search_pattern, relative_filepath, final_resolved_path)
 
         # Security check: Ensure the final resolved path is still within the base_path
-        if final_resolved_path and (base_path == final_resolved_path or base_path in final_resolved_path.parents):
-            # For writing, ensure parent directory exists if it's a new file or a path to a new file
-            # This needs to happen *after* the security check.
-            if not final_resolved_path.exists():
-                final_resolved_path.parent.mkdir(parents=True, exist_ok=True)
-            logging.info(f"Successfully resolved '{relative_filepath}' to safe path '{final_resolved_path}'.")
+        if final_resolved_path and (final_resolved_path == base_path or final_resolved_path.startswith(base_path + os.sep)):
+            logging.info("Successfully resolved '%s' to safe path '%s'.", relative_filepath, final_resolved_path)
             return final_resolved_path
         else:
             # Log actual resolved path if it was computed, otherwise use relative_filepath for logging
@@ -109,44 +214,69 @@ def _resolve_safe_path(relative_filepath: str) -> Path | None:
         logging.error(f"Error resolving path '{relative_filepath}' within workspace '{AGENT_FILES_WORKSPACE}': {e}")
         return None
 
-def read_text_file(relative_filepath: str) -> str:
+class WorkspaceFileError(Exception):
+    """A workspace file could not be read; str(error) is the "Error: ..." message shown to the model."""
+
+class UnsafePath(WorkspaceFileError):
+    """The requested path is invalid or resolves outside AGENT_FILES_WORKSPACE."""
+
+class FileNotFoundInWorkspace(WorkspaceFileError):
+    """No regular file exists at the resolved workspace path."""
+
+def read_workspace_file(relative_filepath: str, safe_path: str | None = None) -> str:
     """
-    Reads content from a text file or extracts text from a PDF file within the agent's workspace.
+    Reads content from a text file or extracts text from a PDF file within the agent's workspace,
+    raising on failure so callers can dispatch on the exception type instead of scanning the result.
 
     Args:
         relative_filepath (str): The path to the file relative to the agent's workspace.
                                  (e.g., 'data/my_document.txt', 'reports/report.pdf')
+        safe_path (str, optional): The path _resolve_safe_path already returned for relative_filepath,
+                                   so a caller that resolved it (e.g. to build an ETag) reads the same
+                                   file without a second lookup. Resolved here when omitted.
 
     Returns:
-        str: The content of the text file, the extracted text from the PDF, or an error/warning message.
+        str: The content of the text file, or the extracted text from the PDF.
              For PDFs, text from each page is concatenated with a newline character in between.
-             - If a PDF is password-protected, returns an error message about the password.
-             - If no text can be extracted from a PDF (e.g., image-based, empty), returns a warning.
-             - If PyPDF2 library is not installed, returns an error for PDF files.
+             If no text can be extracted from a PDF (e.g., image-based, empty), returns a warning.
+
+    Raises:
+        UnsafePath: The path is invalid or resolves outside the workspace.
+        FileNotFoundInWorkspace: Nothing readable exists at the resolved path.
+        WorkspaceFileError: Any other read failure (password-protected or corrupted PDF,
+                            PyPDF2 not installed, I/O or decoding errors).
     """
-    logging.info(f"Tool: Attempting to read file '{relative_filepath}'")
-    safe_path = _resolve_safe_path(relative_filepath)
+    logging.info("Tool: Attempting to read file '%s'", relative_filepath)
+    if safe_path is None:
+        safe_path = _resolve_safe_path(relative_filepath)
     if not safe_path:
-        return "Error: Invalid or disallowed file path. Path must be within the agent's designated workspace."
+        raise UnsafePath("Error: Invalid or disallowed file path. Path must be within the agent's designated workspace.")
 
     try:
-        if not safe_path.is_file(): # Check if it's a file after resolving
-            logging.warning(f"Attempt to read non-file or non-existent file: {safe_path}")
-            return f"Error: File not found or is not a regular file at '{relative_filepath}'."
+        # A single open() stands in for the exists/is_file stat cascade: a missing path or a
+        # directory surfaces here as an exception instead of being probed up front.
+        f = open(safe_path, 'rb')
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        logging.warning(f"Attempt to read non-file or non-existent file: {safe_path}")
+        raise FileNotFoundInWorkspace(f"Error: File not found or is not a regular file at '{relative_filepath}'.")
+    except Exception as e:
+        logging.error(f"Error opening file '{safe_path}': {e}")
+        raise WorkspaceFileError(f"Error: Could not read file. Details: {str(e)}")
 
-        file_extension = safe_path.suffix.lower()
+    try:
+        file_extension = os.path.splitext(safe_path)[1].lower()
 
         if file_extension == '.pdf':
-            logging.info(f"Attempting to extract text from PDF: {safe_path}")
+            logging.info("Attempting to extract text from PDF: %s", safe_path)
             if not PYPDF2_INSTALLED:
                 logging.error("PyPDF2 library is not installed, cannot process PDF file.")
-                return "Error: PDF processing library (e.g., PyPDF2) not installed. Cannot read PDF files."
+                raise WorkspaceFileError("Error: PDF processing library (e.g., PyPDF2) not installed. Cannot read PDF files.")
             
             # PasswordRequiredError is no longer imported locally.
             # We will catch OriginalPdfReadError and check its message.
             reader = None # Initialize reader to None for safe access in except block
             try:
-                with safe_path.open('rb') as f:
+                with f:
                     reader = PdfReader(f) # Assign to reader here
                     if reader.is_encrypted:
                         # For encrypted PDFs, PyPDF2 v3.0.1 might raise OriginalPdfReadError
@@ -176,7 +306,7 @@ def read_text_file(relative_filepath: str) -> str:
                         return "Warning: No text could be extracted from the PDF. The file might be image-based or empty."
                     
                     full_text = "\n".join(text_parts)
-                    logging.info(f"Successfully extracted text from PDF '{relative_filepath}'. Content length: {len(full_text)}")
+                    logging.info("Successfully extracted text from PDF '%s'. Content length: %s", relative_filepath, len(full_text))
                     return full_text
 
             except OriginalPdfReadError as e:
@@ -186,41 +316,88 @@ def read_text_file(relative_filepath: str) -> str:
                     if reader and reader.is_encrypted:
                         is_encrypted_flag = True
                 except Exception as se: # Guard against issues accessing reader object if it's in a bad state
-                    logging.debug(f"Could not determine encryption status from reader during OriginalPdfReadError: {se}")
+                    logging.debug("Could not determine encryption status from reader during OriginalPdfReadError: %s", se)
 
                 error_message_lower = str(e).lower()
                 password_keywords = ["password", "decrypt", "encrypted file"] # "encrypted file" is common in PyPDF2 3.x for password issues
 
                 if is_encrypted_flag and any(keyword in error_message_lower for keyword in password_keywords):
                     logging.warning(f"PDF file '{relative_filepath}' is password-protected: {e}")
-                    return f"Error: PDF file '{relative_filepath}' is password-protected and requires a password to extract text."
+                    raise WorkspaceFileError(f"Error: PDF file '{relative_filepath}' is password-protected and requires a password to extract text.")
                 else:
                     # Check again without relying on is_encrypted_flag, directly from error message,
                     # as PdfReader(f) itself might fail for password-protected files before reader.is_encrypted can be checked.
                     if any(keyword in error_message_lower for keyword in password_keywords):
                          logging.warning(f"PDF file '{relative_filepath}' seems password-protected (error during open/read): {e}")
-                         return f"Error: PDF file '{relative_filepath}' is password-protected and requires a password to extract text."
+                         raise WorkspaceFileError(f"Error: PDF file '{relative_filepath}' is password-protected and requires a password to extract text.")
                     
                     logging.error(f"Could not read PDF file '{relative_filepath}'. File may be corrupted or not a valid PDF: {e}")
-                    return f"Error: Could not read PDF file '{relative_filepath}'. The file may be corrupted or not a valid PDF."
+                    raise WorkspaceFileError(f"Error: Could not read PDF file '{relative_filepath}'. The file may be corrupted or not a valid PDF.")
             
             except Exception as e: # General catch-all for other unexpected PDF processing errors
                 logging.error(f"An unexpected error occurred while processing PDF '{relative_filepath}': {e}", exc_info=True)
-                return f"Error: An unexpected error occurred while processing PDF '{relative_filepath}'. Details: {str(e)}"
+                raise WorkspaceFileError(f"Error: An unexpected error occurred while processing PDF '{relative_filepath}'. Details: {str(e)}")
         # Fallback for text files (original logic)
         # Using a broad else to maintain original behavior for non-PDFs
         else:
-            logging.info(f"Attempting to read text file: {safe_path} (extension: '{file_extension}')")
-            content = safe_path.read_text(encoding="utf-8")
-            logging.info(f"Successfully read file '{relative_filepath}'. Content length: {len(content)}")
+            logging.info("Attempting to read text file: %s (extension: '%s')", safe_path, file_extension)
+            content = f.read().decode("utf-8")
+            logging.info("Successfully read file '%s'. Content length: %s", relative_filepath, len(content))
             return content
             
-    except FileNotFoundError: # Should be caught by is_file, but as a fallback for the text reading part
-        logging.warning(f"File not found at resolved path: {safe_path} (this catch might be redundant if is_file check is robust)")
-        return f"Error: File not found at '{relative_filepath}'."
+    except WorkspaceFileError:
+        raise
     except Exception as e: # General catch-all for other unexpected errors
         logging.error(f"Error reading file '{safe_path}' (outer try-except): {e}")
-        return f"Error: Could not read file. Details: {str(e)}"
+        raise WorkspaceFileError(f"Error: Could not read file. Details: {str(e)}")
+    finally:
+        f.close()
+
+def read_text_file(relative_filepath: str) -> str:
+    """
+    Reads content from a text file or extracts text from a PDF file within the agent's workspace.
+    This is the model-facing tool: failures come back as "Error: ..." strings the model can read.
+
+    Args:
+        relative_filepath (str): The path to the file relative to the agent's workspace.
+                                 (e.g., 'data/my_document.txt', 'reports/report.pdf')
+
+    Returns:
+        str: The content of the text file, the extracted text from the PDF, or an error/warning message.
+             For PDFs, text from each page is concatenated with a newline character in between.
+             - If a PDF is password-protected, returns an error message about the password.
+             - If no text can be extracted from a PDF (e.g., image-based, empty), returns a warning.
+             - If PyPDF2 library is not installed, returns an error for PDF files.
+    """
+    try:
+        return read_workspace_file(relative_filepath)
+    except WorkspaceFileError as e:
+        return str(e)
+
+# Cached result of list_files_in_workspace as one (key, files) tuple, keyed by (workspace path,
+# directory st_mtime_ns). Swapped in a single assignment so concurrent listings never pair a key
+# with another listing's files.
+_LIST_CACHE = {"entry": None}
+
+def _invalidate_workspace_listing() -> None:
+    """Drops the cached workspace listing and name index; called after the agent itself writes a file."""
+    _LIST_CACHE["entry"] = None
+    _WORKSPACE_INDEX["index"] = None
+
+def _write_file_bytes(path: str, data: bytes) -> None:
+    """
+    Writes already-encoded bytes to a file, creating or truncating it.
+    Goes straight to os.write on the descriptor, so the single encoded buffer is the only
+    copy made; no TextIOWrapper/BufferedWriter pair is allocated per call.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+    finally:
+        os.close(fd)
 
 def write_text_file(relative_filepath: str, content: str) -> str:
     """
@@ -232,16 +409,22 @@ def write_text_file(relative_filepath: str, content: str) -> str:
     Returns:
         str: A success message, or an error message.
     """
-    logging.info(f"Tool: Attempting to write to file '{relative_filepath}'. Content length: {len(content)}")
-    safe_path = _resolve_safe_path(relative_filepath) # This also creates parent dirs if needed
+    logging.info("Tool: Attempting to write to file '%s'. Content length: %s", relative_filepath, len(content))
+    safe_path = _resolve_safe_path(relative_filepath)
     if not safe_path:
         return "Error: Invalid or disallowed file path for writing. Path must be within the agent's designated workspace."
 
     try:
-        # _resolve_safe_path should have created parent directories if they didn't exist
-        # and the path is for a new file.
-        safe_path.write_text(content, encoding="utf-8")
-        logging.info(f"Successfully wrote content to file '{relative_filepath}' at '{safe_path}'.")
+        data = content.encode("utf-8")
+        try:
+            _write_file_bytes(safe_path, data)
+        except FileNotFoundError:
+            # Parent directories are only created when a write actually needs them,
+            # so reads never pay for (or cause) a mkdir.
+            os.makedirs(os.path.dirname(safe_path), exist_ok=True)
+            _write_file_bytes(safe_path, data)
+        _invalidate_workspace_listing()
+        logging.info("Successfully wrote content to file '%s' at '%s'.", relative_filepath, safe_path)
         return f"Success: Content written to file '{relative_filepath}'."
     except Exception as e:
         logging.error(f"Error writing file '{safe_path}': {e}")
@@ -250,26 +433,46 @@ def write_text_file(relative_filepath: str, content: str) -> str:
 def list_files_in_workspace() -> list[str]:
     """
     Lists all files and directories directly within the AGENT_FILES_WORKSPACE.
+    The listing is cached against the workspace directory's mtime, so repeated calls on an
+    unchanged workspace cost a single stat.
     Returns:
         list[str]: A list of names of files and directories.
                    Returns an empty list if the workspace is empty or if an error occurs.
     """
     logging.info("Tool: Attempting to list files in agent workspace.")
-    if not AGENT_FILES_WORKSPACE.exists():
+    try:
+        workspace_stat = os.stat(AGENT_FILES_WORKSPACE)
+    except FileNotFoundError:
         logging.error(f"Agent workspace directory '{AGENT_FILES_WORKSPACE}' does not exist.")
         return []
-    if not AGENT_FILES_WORKSPACE.is_dir():
+    except OSError as e:
+        logging.error(f"Error listing files in workspace '{AGENT_FILES_WORKSPACE}': {e}")
+        return []
+    if not stat.S_ISDIR(workspace_stat.st_mode):
         logging.error(f"Agent workspace path '{AGENT_FILES_WORKSPACE}' is not a directory.")
         return []
 
+    cache_key = (str(AGENT_FILES_WORKSPACE), workspace_stat.st_mtime_ns)
+    cached = _LIST_CACHE["entry"]
+    if cached is not None and cached[0] == cache_key:
+        logging.info("Returning cached workspace listing: %s", cached[1])
+        return list(cached[1])
+
     try:
-        entries = [entry.name for entry in AGENT_FILES_WORKSPACE.iterdir()]
-        logging.info(f"Successfully listed files in workspace: {entries}")
-        return entries
+        listed_at_ns = time.time_ns()
+        entries = [name for name in os.listdir(AGENT_FILES_WORKSPACE) if not _is_upload_temp(name)]
     except OSError as e:
         logging.error(f"Error listing files in workspace '{AGENT_FILES_WORKSPACE}': {e}")
         return []
 
+    # Directory mtimes come from a coarse kernel clock, so a change made in the same tick as
+    # this listing could leave the mtime unchanged. Only cache listings taken clearly after
+    # the last modification.
+    if listed_at_ns - workspace_stat.st_mtime_ns > _MTIME_GRANULARITY_NS:
+        _LIST_CACHE["entry"] = (cache_key, entries)
+    logging.info("Successfully listed files in workspace: %s", entries)
+    return list(entries)
+
 # --- Gemini Tool Definitions ---
 AVAILABLE_TOOLS_PYTHON_FUNCTIONS = {
     "read_text_file": read_text_file,
@@ -315,7 +518,30 @@ FILE_TOOLS_DECLARATIONS = [
     )
 ]
 
+# Built once at import: GenerativeModel accepts a FunctionLibrary as-is, so model
+# initialization no longer re-validates and re-flattens the tool declarations.
+FILE_TOOLS_LIBRARY = types.FunctionLibrary(tools=FILE_TOOLS_DECLARATIONS)
+
 # --- Gemini Model Interaction ---
+# Model-wide prompt and safety settings live at module scope: they are built once at import
+# and there is exactly one definition of each to edit.
+SYSTEM_INSTRUCTION = (
+    "You are a helpful AI assistant.\n"
+    "When a user asks you to read a file, you should use the 'read_text_file' tool.\n"
+    "This tool can read plain text files (like .txt, .md) and can also extract text from PDF files (.pdf).\n"
+    "If the user provides a filename without an extension (e.g., 'myfile'), "
+    "the tool will automatically search for common text file extensions (e.g., 'myfile.txt', 'myfile.md'). For PDF files, please ensure the filename includes the .pdf extension if possible.\n"
+    "If a user refers to a PDF file, attempt to use 'read_text_file' to extract its content.\n"
+    "Do NOT ask the user for a file extension if they provide only a base filename for what seems like a text document; try reading it directly.\n"
+    "Only ask for clarification if the 'read_text_file' tool explicitly reports an error that the file cannot be found or cannot be processed."
+)
+
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"} ]
+
 def initialize_gemini_model(api_key: str = None) -> genai.GenerativeModel | None:
     """
     Configures and initializes the Gemini generative model.
@@ -338,29 +564,15 @@ def initialize_gemini_model(api_key: str = None) -> genai.GenerativeModel | None
 
     try:
         genai.configure(api_key=api_key)
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"} ]
         model = genai.GenerativeModel(
             model_name_to_use,
             # Pass the tool declarations to the model during initialization
             # This allows the model to know about the tools from the start.
             # Some SDK versions might prefer tools passed in send_message,
             # but declaring them here is often beneficial.
-            tools=FILE_TOOLS_DECLARATIONS,
-            safety_settings=safety_settings,
-            system_instruction=(
-                "You are a helpful AI assistant.\n"
-                "When a user asks you to read a file, you should use the 'read_text_file' tool.\n"
-                "This tool can read plain text files (like .txt, .md) and can also extract text from PDF files (.pdf).\n"
-                "If the user provides a filename without an extension (e.g., 'myfile'), "
-                "the tool will automatically search for common text file extensions (e.g., 'myfile.txt', 'myfile.md'). For PDF files, please ensure the filename includes the .pdf extension if possible.\n"
-                "If a user refers to a PDF file, attempt to use 'read_text_file' to extract its content.\n"
-                "Do NOT ask the user for a file extension if they provide only a base filename for what seems like a text document; try reading it directly.\n"
-                "Only ask for clarification if the 'read_text_file' tool explicitly reports an error that the file cannot be found or cannot be processed."
-            )
+            tools=FILE_TOOLS_LIBRARY,
+            safety_settings=SAFETY_SETTINGS,
+            system_instruction=SYSTEM_INSTRUCTION
         )
         logging.info(f"🤖 Gemini AI Model '{model_name_to_use}' initialized successfully with system instruction.")
         return model
@@ -385,7 +597,7 @@ def get_gemini_response(model: genai.GenerativeModel, user_message: str, chat_hi
         logging.error("Model not provided to get_gemini_response.")
         return None
 
-    logging.info(f"User message: '{user_message[:100]}...'")
+    logging.info("User message: '%.100s...'", user_message)
 
     try:
         # Start a chat session. The model was initialized with tools,
@@ -403,21 +615,26 @@ def get_gemini_response(model: genai.GenerativeModel, user_message: str, chat_hi
         while True:
             # Check for function call in the response
             # The structure of response.candidates[0].content.parts needs careful handling
+            # One pass over the parts picks up the first function call and, for the case where
+            # there is none, the text pieces that make up the final answer.
             function_call_part = None
+            text_parts = []
             if response.candidates and \
                response.candidates[0].content and \
                response.candidates[0].content.parts:
                 for part in response.candidates[0].content.parts:
                     if part.function_call:
-                        function_call_part = part
-                        break
+                        if function_call_part is None:
+                            function_call_part = part
+                    elif getattr(part, 'text', None):
+                        text_parts.append(part.text)
             
             if function_call_part:
                 fc = function_call_part.function_call
                 tool_name = fc.name
                 tool_args = {key: value for key, value in fc.args.items()}
                 
-                logging.info(f"🤖 Gemini requested to use tool: '{tool_name}' with args: {tool_args}")
+                logging.info("🤖 Gemini requested to use tool: '%s' with args: %s", tool_name, tool_args)
 
                 if tool_name in AVAILABLE_TOOLS_PYTHON_FUNCTIONS:
                     tool_function = AVAILABLE_TOOLS_PYTHON_FUNCTIONS[tool_name]
@@ -426,7 +643,7 @@ def get_gemini_response(model: genai.GenerativeModel, user_message: str, chat_hi
                     try:
                         # Execute the actual Python function for the tool
                         tool_result = tool_function(**tool_args)
-                        logging.info(f"Tool '{tool_name}' executed. Result snippet: {str(tool_result)[:200]}...")
+                        logging.info("Tool '%s' executed. Result snippet: %.200s...", tool_name, tool_result)
                     except TypeError as te: # Catch argument mismatches specifically
                         logging.error(f"💥 Argument mismatch for tool {tool_name} with args {tool_args}: {te}")
                         tool_result = f"Error: Tool '{tool_name}' called with incorrect arguments. Details: {te}"
@@ -465,28 +682,27 @@ def get_gemini_response(model: genai.GenerativeModel, user_message: str, chat_hi
                     )
             else:
                 # No function call, this should be the final text response from the model
-                final_text_response = ""
-                if response.candidates and \
-                   response.candidates[0].content and \
-                   response.candidates[0].content.parts:
-                    # Concatenate text from all parts that have text
-                    final_text_response = "".join(part.text for part in response.candidates[0].content.parts if hasattr(part, 'text') and part.text)
-                
-                if not final_text_response and response.prompt_feedback and response.prompt_feedback.block_reason:
-                    logging.warning(f"Gemini response was blocked. Reason: {response.prompt_feedback.block_reason_message or response.prompt_feedback.block_reason}")
-                    return f"Sorry, your request was blocked by the content safety filter. Reason: {response.prompt_feedback.block_reason_message or response.prompt_feedback.block_reason}"
-
-                if not final_text_response:
-                     logging.warning(f"Gemini response had no usable text parts. Full response candidate: {response.candidates[0] if response.candidates else 'No candidates'}")
-                     # Check if there's an error message in the response itself
-                     if response.candidates and response.candidates[0].finish_reason.name != "STOP":
-                         return f"Sorry, the AI model finished unexpectedly. Reason: {response.candidates[0].finish_reason.name}"
-                     return "Sorry, I couldn't generate a text response for that."
-
-                logging.info(f"Gemini final response: '{final_text_response[:200]}...'")
-                # The 'chat' object now holds the updated history including this interaction.
-                # If you need to explicitly manage history outside this function, you'd extract it from chat.history
-                return final_text_response
+                final_text_response = "".join(text_parts)
+
+                if final_text_response:
+                    logging.info("Gemini final response: '%.200s...'", final_text_response)
+                    # The 'chat' object now holds the updated history including this interaction.
+                    # If you need to explicitly manage history outside this function, you'd extract it from chat.history
+                    return final_text_response
+
+                # Only an empty answer needs the prompt feedback / finish reason inspected.
+                prompt_feedback = response.prompt_feedback
+                if prompt_feedback and prompt_feedback.block_reason:
+                    block_reason = prompt_feedback.block_reason_message or prompt_feedback.block_reason
+                    logging.warning(f"Gemini response was blocked. Reason: {block_reason}")
+                    return f"Sorry, your request was blocked by the content safety filter. Reason: {block_reason}"
+
+                candidate = response.candidates[0] if response.candidates else None
+                logging.warning(f"Gemini response had no usable text parts. Full response candidate: {candidate if candidate else 'No candidates'}")
+                # Check if there's an error message in the response itself
+                if candidate and candidate.finish_reason.name != "STOP":
+                    return f"Sorry, the AI model finished unexpectedly. Reason: {candidate.finish_reason.name}"
+                return "Sorry, I couldn't generate a text response for that."
 
     except Exception as e:
         logging.error(f"💥 Error in get_gemini_response (outer try-except): {e}", exc_info=True)
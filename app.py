@@ -1,30 +1,117 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, g, Response
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import or_, event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.schema import CreateIndex
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField
-from wtforms.validators import DataRequired, Email, EqualTo, Length
-from werkzeug.security import generate_password_hash, check_password_hash
+from wtforms.validators import DataRequired, EqualTo, Length, Regexp
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 from werkzeug.utils import secure_filename
-from agent import initialize_gemini_model, get_gemini_response, list_files_in_workspace, read_text_file, AGENT_FILES_WORKSPACE
+from werkzeug.exceptions import RequestEntityTooLarge
+from agent import initialize_gemini_model, get_gemini_response, list_files_in_workspace, read_workspace_file, _resolve_safe_path, AGENT_FILES_WORKSPACE
+from agent import WorkspaceFileError, UnsafePath, FileNotFoundInWorkspace, UPLOAD_TEMP_PREFIX, UPLOAD_TEMP_SUFFIX
+import click
+import functools
+import orjson
 import os
+import re
 import logging
+import stat
+import tempfile
+import time
+import zlib
 from pathlib import Path
 
 # Configure basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson; used by jsonify and request.json alike."""
+
+    def _option(self):
+        # Mirror json.dumps: honour sort_keys, and stringify int/float/etc. keys instead of raising.
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # orjson has no sort_keys/indent equivalents beyond its own option flags.
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._option()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response instead of round-tripping through str.
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self._option() | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=option), mimetype=self.mimetype
+        )
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # --- Constants for File Upload ---
-ALLOWED_EXTENSIONS = {'.txt', '.pdf'}
+ALLOWED_EXTENSIONS = frozenset(('txt', 'pdf'))  # compared against the lowercased text after the last '.'
 MAX_FILE_SIZE = 1 * 1024 * 1024 * 1024  # 1GB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MiB per read/write while streaming an upload to disk
+VIEW_FILE_CHUNK_SIZE = 64 * 1024  # 64KiB per chunk when streaming a text file from /view_file
+MULTIPART_OVERHEAD_ALLOWANCE = 64 * 1024  # room for multipart boundaries and part headers around the file
+
+# --- Password Hashing ---
+# Argon2id at the OWASP-recommended minimum (19 MiB, 2 passes, 1 lane): a login costs ~20ms
+# of CPU instead of the ~90ms of Werkzeug's scrypt default. Test runs can lower
+# ARGON2_TIME_COST / ARGON2_MEMORY_COST (minimum 1 pass, 8 KiB) in the environment or in app.config.
+app.config.setdefault('ARGON2_TIME_COST', int(os.getenv('ARGON2_TIME_COST', '2')))
+app.config.setdefault('ARGON2_MEMORY_COST', int(os.getenv('ARGON2_MEMORY_COST', str(19 * 1024))))
+
+@functools.cache
+def _build_password_hasher(time_cost, memory_cost):
+    return PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=1)
+
+def password_hasher():
+    """Returns the Argon2 hasher for the current ARGON2_* config, built once per setting."""
+    return _build_password_hasher(app.config['ARGON2_TIME_COST'], app.config['ARGON2_MEMORY_COST'])
+
+# Prefixes of hashes written by werkzeug.security before the switch to Argon2.
+LEGACY_HASH_PREFIXES = ('pbkdf2:', 'scrypt:')
+# Logins whose hash verification takes longer than this are logged as a warning.
+SLOW_PASSWORD_VERIFY_SECONDS = 0.5
 
 # --- Configuration ---
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY")
 db_file_path = Path(app.instance_path) / 'users.db'
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_file_path.resolve()}'
+# DATABASE_URL may point at another SQLite database; the app relies on SQLite-specific SQL.
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL", f'sqlite:///{db_file_path.resolve()}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Werkzeug refuses larger bodies itself (413) before any of it is parsed or spooled.
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE + MULTIPART_OVERHEAD_ALLOWANCE
+# Keep enough pooled connections for a threaded worker so each request reuses an open, already
+# tuned connection; SQLite connections are local files, so a pre-ping round trip on checkout
+# would only add latency. Pooled connections move between worker threads, hence check_same_thread.
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 20,
+    'max_overflow': 20,
+    'connect_args': {'check_same_thread': False, 'timeout': 5},
+}
+if make_url(app.config['SQLALCHEMY_DATABASE_URI']).database in (None, '', ':memory:'):
+    # An in-memory database only exists on the connection that created it, so Flask-SQLAlchemy
+    # shares a single connection (StaticPool), which takes no pool sizing.
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'check_same_thread': False}}
 
 # --- Database & Login Manager Initialization ---
 db = SQLAlchemy(app)
@@ -33,48 +120,137 @@ login_manager.init_app(app)
 login_manager.login_view = 'login' 
 login_manager.login_message_category = 'info'
 
+# --- SQLite Connection Pragmas ---
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # readers no longer block on the single writer
+    "PRAGMA synchronous=NORMAL",  # fsync on checkpoint instead of every commit (safe under WAL)
+    "PRAGMA mmap_size=268435456",  # 256MiB memory-mapped reads
+    "PRAGMA cache_size=-64000",  # ~64MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",  # wait up to 5s for the write lock instead of failing with SQLITE_BUSY
+    "PRAGMA foreign_keys=ON",
+)
+
+# Larger pages keep the small, hot user table and its indexes in fewer pages, so each
+# auth lookup touches fewer mmap'd pages. Applied by `flask create_db`.
+SQLITE_PAGE_SIZE = 8192
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+with app.app_context():
+    # The PRAGMAs are SQLite-only; never send them to whatever engine DATABASE_URL names.
+    if db.engine.dialect.name == "sqlite":
+        event.listen(db.engine, "connect", _apply_sqlite_pragmas)
+
 # --- User Model ---
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(256)) # Increased length for future-proofing
+    username = db.Column(db.String(80), unique=True, nullable=False, index=True)
+    email = db.Column(db.String(120), unique=True, nullable=False, index=True)
+    password_hash = db.Column(db.String(512)) # Argon2 encoded hashes carry their parameters and salt
+
+    # Emails compare case-insensitively: this unique expression index makes lower(email)
+    # lookups a single B-tree probe and rejects registrations differing only in case,
+    # including against rows stored before addresses were normalized.
+    __table_args__ = (db.Index('ix_user_email_lower', func.lower(email), unique=True),)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher().hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        if not self.password_hash:
+            return False
+        if self.password_hash.startswith(LEGACY_HASH_PREFIXES):
+            return check_password_hash(self.password_hash, password)
+        try:
+            return password_hasher().verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def password_needs_rehash(self):
+        """True for legacy Werkzeug hashes and Argon2 hashes made with older parameters."""
+        if not self.password_hash or self.password_hash.startswith(LEGACY_HASH_PREFIXES):
+            return True
+        try:
+            return password_hasher().check_needs_rehash(self.password_hash)
+        except InvalidHashError:
+            return True
 
     def __repr__(self):
         return f'<User {self.username}>'
 
 # --- Forms (using Flask-WTF) ---
+# Validators are stateless, so a single instance of each is built at import and shared by
+# every form. The email check is a cheap structural regex compiled once, in place of WTForms'
+# Email() and the email_validator package; the address is proven when the user actually uses it.
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+email_format = Regexp(EMAIL_RE, message='Invalid email address.')
+data_required = DataRequired()
+username_length = Length(min=3, max=80)
+email_length = Length(max=120)
+password_length = Length(min=6)
+passwords_match = EqualTo('password', message='Passwords must match.')
+
+def normalize_email(value):
+    """Form filter: stores and looks up addresses trimmed and lower-cased."""
+    return value.strip().lower() if value else value
+
 class LoginForm(FlaskForm):
-    email = StringField('Email', validators=[DataRequired(), Email()])
-    password = PasswordField('Password', validators=[DataRequired()])
+    email = StringField('Email', filters=[normalize_email], validators=[data_required, email_format])
+    password = PasswordField('Password', validators=[data_required])
     remember_me = BooleanField('Remember Me')
     submit = SubmitField('Login 🔑')
 
 class RegistrationForm(FlaskForm):
-    username = StringField('Username', validators=[DataRequired(), Length(min=3, max=80)])
-    email = StringField('Email', validators=[DataRequired(), Email(), Length(max=120)])
-    password = PasswordField('Password', validators=[DataRequired(), Length(min=6)])
-    confirm_password = PasswordField('Confirm Password',
-                                     validators=[DataRequired(), EqualTo('password', message='Passwords must match.')])
+    username = StringField('Username', validators=[data_required, username_length])
+    email = StringField('Email', filters=[normalize_email], validators=[data_required, email_format, email_length])
+    password = PasswordField('Password', validators=[data_required, password_length])
+    confirm_password = PasswordField('Confirm Password', validators=[data_required, passwords_match])
     submit = SubmitField('Register 📝')
 
 # --- Flask-Login User Loader ---
+def _request_user_cache():
+    """Per-request identity map of User rows by id; lives on flask.g so it dies with the request."""
+    if 'user_cache' not in g:
+        g.user_cache = {}
+    return g.user_cache
+
+def get_user_by_email(email):
+    """Looks a user up by email once per request and shares the row with load_user."""
+    by_email = g.setdefault('user_cache_email', {})
+    if email not in by_email:
+        user = User.query.filter(func.lower(User.email) == email.lower()).first()
+        by_email[email] = user
+        if user is not None:
+            _request_user_cache()[user.id] = user
+    return by_email[email]
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-
-# Initialize Gemini model when the app starts
-model = initialize_gemini_model()
-
-if not model:
-    logging.error("🔴 Gemini model failed to initialize. The /ask endpoint will not work.")
+    # Memoize per request so repeated current_user lookups cost a single
+    # primary-key SELECT. A cross-request cache is deliberately avoided:
+    # the User instance is bound to the request's session.
+    user_id = int(user_id)
+    cache = _request_user_cache()
+    if user_id not in cache:
+        cache[user_id] = db.session.get(User, user_id)
+    return cache[user_id]
+
+
+# Initialize the Gemini model on first use rather than at import, so importing the app (workers,
+# CLI commands, tests) does no SDK setup; under a preloading server, warm it before forking.
+@functools.cache
+def _get_model():
+    model = initialize_gemini_model()
+    if not model:
+        logging.error("🔴 Gemini model failed to initialize. The /ask endpoint will not work.")
+    return model
 
 # --- Routes ---
 @app.route('/')
@@ -91,19 +267,28 @@ def register():
         return redirect(url_for('index'))
     form = RegistrationForm()
     if form.validate_on_submit():
-        existing_user_email = User.query.filter_by(email=form.email.data).first()
-        if existing_user_email:
-            flash('That email address is already registered. Please log in.', 'warning')
-            return redirect(url_for('login'))
-        existing_user_username = User.query.filter_by(username=form.username.data).first()
-        if existing_user_username:
+        # Hash before touching the database so the write transaction stays short, then let the
+        # unique indexes decide: a single INSERT either claims both names or inserts nothing.
+        password_hash = password_hasher().hash(form.password.data)
+        stmt = sqlite_insert(User.__table__).values(
+            username=form.username.data, email=form.email.data, password_hash=password_hash
+        ).on_conflict_do_nothing().returning(User.__table__.c.id)
+        created = db.session.execute(stmt).first()
+        db.session.commit()
+
+        if created is None:
+            # Only the rejected path pays for working out which field collided; an email clash
+            # takes precedence over a username clash.
+            conflicts = db.session.query(User.email, User.username).filter(
+                or_(func.lower(User.email) == form.email.data, User.username == form.username.data)
+            ).limit(2).all()
+            if any(row.email.lower() == form.email.data for row in conflicts):
+                flash('That email address is already registered. Please log in.', 'warning')
+                return redirect(url_for('login'))
             flash('That username is already taken. Please choose a different one.', 'warning')
             return redirect(url_for('register'))
 
-        user = User(username=form.username.data, email=form.email.data)
-        user.set_password(form.password.data)
-        db.session.add(user)
-        db.session.commit()
+        g.get('user_cache_email', {}).pop(form.email.data, None)
         flash('Congratulations, you are now a registered user! Please log in. 🎉', 'success')
         return redirect(url_for('login'))
     return render_template('register.html', title='Register', form=form)
@@ -114,8 +299,18 @@ def login():
         return redirect(url_for('index')) # Or a user-specific dashboard
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
-        if user and user.check_password(form.password.data):
+        user = get_user_by_email(form.email.data)
+        verify_started = time.perf_counter()
+        password_ok = user is not None and user.check_password(form.password.data)
+        verify_seconds = time.perf_counter() - verify_started
+        if verify_seconds > SLOW_PASSWORD_VERIFY_SECONDS:
+            logging.warning(f"🐢 Password verification took {verify_seconds:.3f}s; check the hashing parameters and worker CPU.")
+        if password_ok:
+            # Upgrade the stored hash only when its scheme or parameters are out of date,
+            # so a normal login stays a single verify with no write.
+            if user.password_needs_rehash():
+                user.set_password(form.password.data)
+                db.session.commit()
             login_user(user, remember=form.remember_me.data)
             next_page = request.args.get('next')
             flash(f'Welcome back, {user.username}! 👋', 'success')
@@ -141,11 +336,19 @@ def chat_page():
 @login_required # Secure this endpoint
 def ask():
     """Handles chat messages from the user and returns the AI's response."""
-    if not model:
+    model = _get_model()
+    if model is None:
         return jsonify({'error': 'Gemini model not initialized. Check server logs.'}), 500
 
     try:
-        user_message = request.json.get('message')
+        # Parse the raw body directly: no cached copy of the request data, and an empty
+        # or non-object body is treated as a missing message rather than raising.
+        body = request.get_data(cache=False)
+        try:
+            payload = orjson.loads(body) if body else None
+        except orjson.JSONDecodeError:
+            return jsonify({'error': 'Request body is not valid JSON.'}), 400
+        user_message = payload.get('message') if isinstance(payload, dict) else None
         if not user_message:
             return jsonify({'error': 'No message provided.'}), 400
 
@@ -161,6 +364,10 @@ def ask():
         logging.error(f"💥 Error in /ask endpoint for user {current_user.id}: {e}")
         return jsonify({'error': 'An internal error occurred.'}), 500
 
+# Last /list_files (listing, body, etag), reused while the listing is unchanged. Replaced as one
+# tuple so concurrent requests never pair a body with another listing's ETag.
+_LIST_FILES_RESPONSE = {"entry": (None, None, None)}
+
 @app.route('/list_files', methods=['GET'])
 @login_required # Secure this endpoint
 def list_agent_files():
@@ -170,11 +377,46 @@ def list_agent_files():
         # e.g., workspace_path = os.path.join('user_workspaces', str(current_user.id))
         # file_list = list_files_in_workspace(workspace_path)
         file_list = list_files_in_workspace() # Using your existing function
-        return jsonify(files=file_list)
+        # Serialize (and hash) the listing only when it changes; pollers holding the
+        # current ETag get a bodiless 304.
+        cached_files, body, etag = _LIST_FILES_RESPONSE["entry"]
+        if cached_files != file_list:
+            body = orjson.dumps({'files': file_list}, option=orjson.OPT_APPEND_NEWLINE)
+            etag = f"{zlib.crc32(body):08x}-{len(body):x}"
+            _LIST_FILES_RESPONSE["entry"] = (file_list, body, etag)
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response.make_conditional(request)
     except Exception as e:
         logging.error(f"💥 Error in /list_files endpoint for user {current_user.id}: {e}")
         return jsonify({'error': 'Could not list files due to an internal server error.'}), 500
 
+def _file_validators(safe_path, representation):
+    """
+    Returns (etag, last_modified) for a workspace file from its mtime and size, tagged with the
+    representation served, or (None, None) if it is not a readable regular file.
+    """
+    try:
+        st = os.stat(safe_path)
+    except OSError:
+        return None, None
+    if not stat.S_ISREG(st.st_mode):
+        return None, None
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}-{representation}", st.st_mtime
+
+def _with_validators(response, etag, last_modified):
+    if etag is not None:
+        response.set_etag(etag)
+        response.last_modified = last_modified
+    response.vary.add('Accept')
+    return response
+
+def _iter_file_chunks(f):
+    """Yields an open binary file in VIEW_FILE_CHUNK_SIZE pieces, closing it when the response ends."""
+    with f:
+        while chunk := f.read(VIEW_FILE_CHUNK_SIZE):
+            yield chunk
+
 @app.route('/view_file/<path:filename>', methods=['GET'])
 @login_required # Secure this endpoint
 def view_agent_file(filename):
@@ -183,65 +425,183 @@ def view_agent_file(filename):
         return jsonify({'error': 'No filename provided.'}), 400
 
     logging.info(f"User {current_user.username} attempting to view file: {filename}")
-    try:
-        # Again, consider user-specific paths if needed
-        file_content = read_text_file(filename)
 
-        if file_content.startswith("Error: File not found"):
+    # Clients that prefer plain text get text files streamed straight from disk in chunks, with
+    # no whole-file str and no JSON escaping; PDFs need text extraction and stay on the JSON path.
+    safe_path = _resolve_safe_path(filename)
+    stream_text = (safe_path is not None and not safe_path.lower().endswith('.pdf')
+                   and request.accept_mimetypes.best_match(('application/json', 'text/plain')) == 'text/plain')
+
+    # An unchanged file (same mtime and size) is answered with 304 before it is opened or parsed.
+    etag, last_modified = _file_validators(safe_path, 'text' if stream_text else 'json') if safe_path else (None, None)
+    if etag is not None and request.if_none_match.contains(etag):
+        return _with_validators(Response(status=304), etag, last_modified)
+
+    if stream_text:
+        try:
+            f = open(safe_path, 'rb')
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
             logging.warning(f"File not found for user {current_user.username}: {filename}")
-            return jsonify({'error': file_content}), 404
-        elif file_content.startswith("Error:"):
-            logging.error(f"Error reading file '{filename}' for user {current_user.username}: {file_content}")
-            return jsonify({'error': file_content}), 500
-
-        return jsonify({'filename': filename, 'content': file_content})
+            return jsonify({'error': f"Error: File not found or is not a regular file at '{filename}'."}), 404
+        return _with_validators(Response(_iter_file_chunks(f), mimetype='text/plain'), etag, last_modified)
 
+    try:
+        # Reuse the path the ETag was built from, so the body is read from that same file.
+        file_content = read_workspace_file(filename, safe_path=safe_path)
+    except FileNotFoundInWorkspace as e:
+        logging.warning(f"File not found for user {current_user.username}: {filename}")
+        return jsonify({'error': str(e)}), 404
+    except UnsafePath as e:
+        logging.warning(f"Disallowed path requested by user {current_user.username}: {filename}")
+        return jsonify({'error': str(e)}), 400
+    except WorkspaceFileError as e:
+        logging.error(f"Error reading file '{filename}' for user {current_user.username}: {e}")
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         logging.error(f"💥 Unexpected error in /view_file/{filename} for user {current_user.username}: {e}")
         return jsonify({'error': f'An unexpected error occurred while trying to read the file {filename}.'}), 500
 
-# --- File Upload Route ---
-@app.route('/upload_file', methods=['POST'])
+    return _with_validators(jsonify({'filename': filename, 'content': file_content}), etag, last_modified)
+
+@app.route('/raw_file/<path:filename>', methods=['GET'])
 @login_required
-def upload_file():
-    """Handles file uploads from the user."""
-    if 'file' not in request.files:
-        logging.warning(f"File upload attempt by {current_user.username} failed: No file part in request.")
-        return jsonify({'error': 'No file part in the request.'}), 400
+def raw_agent_file(filename):
+    """
+    Streams a workspace file unmodified via send_file (sendfile under Gunicorn), with conditional GET support.
+    The model writes these files, so they are never served with a type a browser would render as a page:
+    PDFs go out as application/pdf and everything else as text/plain, with nosniff.
+    """
+    safe_path = _resolve_safe_path(filename)
+    if not safe_path:
+        logging.warning(f"User {current_user.username} requested disallowed raw file path: {filename}")
+        return jsonify({'error': 'Invalid or disallowed file path.'}), 400
 
-    file = request.files['file']
+    try:
+        mimetype = 'application/pdf' if safe_path.lower().endswith('.pdf') else 'text/plain'  # Werkzeug adds charset=utf-8
+        response = send_file(safe_path, mimetype=mimetype, conditional=True, etag=True)
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+    except (FileNotFoundError, IsADirectoryError):
+        logging.warning(f"Raw file not found for user {current_user.username}: {filename}")
+        return jsonify({'error': f"File not found at '{filename}'."}), 404
+    except Exception as e:
+        logging.error(f"💥 Unexpected error in /raw_file/{filename} for user {current_user.username}: {e}")
+        return jsonify({'error': f'An unexpected error occurred while trying to send the file {filename}.'}), 500
 
-    if file.filename == '':
-        logging.warning(f"File upload attempt by {current_user.username} failed: No selected file.")
-        return jsonify({'error': 'No selected file.'}), 400
+# --- File Upload Route ---
+def _copy_stream_to_fd(stream, fd):
+    """
+    Copies stream into the file descriptor fd (closing it) through one reused buffer.
+    Streams with readinto() fill the buffer in place, so no bytes object is allocated per chunk,
+    and the unbuffered os.write goes straight to the kernel without a second userspace copy.
+    Returns the number of bytes copied, or None as soon as more than MAX_FILE_SIZE bytes are seen.
+    """
+    buffer = memoryview(bytearray(UPLOAD_CHUNK_SIZE))
+    readinto = getattr(stream, 'readinto', None)
+    written = 0
+    try:
+        while True:
+            if readinto is not None:
+                n = readinto(buffer)
+                chunk = buffer[:n] if n else None
+            else:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                n = len(chunk)
+            if not n:
+                return written
+            written += n
+            if written > MAX_FILE_SIZE:
+                return None
+            while chunk:
+                chunk = chunk[os.write(fd, chunk):]
+    finally:
+        os.close(fd)
+
+def _stream_upload_to_workspace(stream, filename):
+    """
+    Copies an upload stream into the agent workspace in UPLOAD_CHUNK_SIZE pieces.
+    The data lands in a temporary file next to the target and is only renamed into place once
+    complete, so an oversized upload never clobbers an existing file of the same name.
+    Returns the number of bytes written, or None if MAX_FILE_SIZE was exceeded.
+    """
+    workspace = Path(AGENT_FILES_WORKSPACE)
+    try:
+        fd, tmp_name = tempfile.mkstemp(dir=workspace, prefix=UPLOAD_TEMP_PREFIX, suffix=UPLOAD_TEMP_SUFFIX)
+    except FileNotFoundError:
+        # agent.py creates the workspace at import; only recreate it if it was removed since.
+        workspace.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=workspace, prefix=UPLOAD_TEMP_PREFIX, suffix=UPLOAD_TEMP_SUFFIX)
+    try:
+        written = _copy_stream_to_fd(stream, fd)
+        if written is None:
+            os.unlink(tmp_name)
+            return None
+        os.replace(tmp_name, workspace / filename)
+        return written
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
 
-    _, ext = os.path.splitext(file.filename)
-    if ext.lower() not in ALLOWED_EXTENSIONS:
-        logging.warning(f"File upload attempt by {current_user.username} for '{file.filename}' failed: File type not allowed.")
+@app.route('/upload_file', methods=['POST'])
+@login_required
+def upload_file():
+    """
+    Handles file uploads from the user.
+    Accepts either a multipart form with a 'file' part, or a raw 'application/octet-stream'
+    body with the file name in the 'X-Filename' header. Either way the body is streamed to disk
+    in chunks and its size is counted as it is written.
+    """
+    is_raw_upload = request.mimetype == 'application/octet-stream'
+    # Reject on the declared Content-Length before reading a single byte of the body.
+    size_limit = MAX_FILE_SIZE if is_raw_upload else MAX_FILE_SIZE + MULTIPART_OVERHEAD_ALLOWANCE
+    if request.content_length is not None and request.content_length > size_limit:
+        logging.warning(f"File upload attempt by {current_user.username} failed: Content-Length {request.content_length} exceeds the limit.")
+        return jsonify({'error': 'File exceeds maximum size of 1GB.'}), 413
+
+    if is_raw_upload:
+        original_filename = request.headers.get('X-Filename', '')
+        stream = request.stream
+        if not original_filename:
+            logging.warning(f"File upload attempt by {current_user.username} failed: No X-Filename header on raw upload.")
+            return jsonify({'error': 'No selected file.'}), 400
+    else:
+        if 'file' not in request.files:
+            logging.warning(f"File upload attempt by {current_user.username} failed: No file part in request.")
+            return jsonify({'error': 'No file part in the request.'}), 400
+
+        file = request.files['file']
+
+        if file.filename == '':
+            logging.warning(f"File upload attempt by {current_user.username} failed: No selected file.")
+            return jsonify({'error': 'No selected file.'}), 400
+        original_filename = file.filename
+        stream = file.stream
+
+    stem, _, ext = original_filename.rpartition('.')
+    if not stem or ext.lower() not in ALLOWED_EXTENSIONS:
+        logging.warning(f"File upload attempt by {current_user.username} for '{original_filename}' failed: File type not allowed.")
         return jsonify({'error': 'File type not allowed. Only .txt and .pdf files are accepted.'}), 400
 
-    # Check file size
-    file.seek(0, os.SEEK_END)
-    file_size = file.tell()
-    file.seek(0)  # Reset pointer to the beginning of the file
-
-    if file_size > MAX_FILE_SIZE:
-        logging.warning(f"File upload attempt by {current_user.username} for '{file.filename}' failed: File too large ({file_size} bytes).")
-        return jsonify({'error': f'File exceeds maximum size of 1GB.'}), 400
-
+    filename = secure_filename(original_filename)
     try:
-        filename = secure_filename(file.filename)
-        # Ensure the AGENT_FILES_WORKSPACE directory exists (it should be created by agent.py, but good to be safe)
-        Path(AGENT_FILES_WORKSPACE).mkdir(parents=True, exist_ok=True)
-        save_path = Path(AGENT_FILES_WORKSPACE) / filename
-        
-        file.save(save_path)
-        logging.info(f"File '{filename}' uploaded successfully by user {current_user.username} to {save_path}.")
-        return jsonify({'message': f'File {filename} uploaded successfully.'}), 200
+        file_size = _stream_upload_to_workspace(stream, filename)
     except Exception as e:
         logging.error(f"💥 Error saving file '{filename}' for user {current_user.username}: {e}")
         return jsonify({'error': 'An error occurred while saving the file.'}), 500
 
+    if file_size is None:
+        logging.warning(f"File upload attempt by {current_user.username} for '{original_filename}' failed: File larger than {MAX_FILE_SIZE} bytes.")
+        return jsonify({'error': 'File exceeds maximum size of 1GB.'}), 413
+
+    logging.info(f"File '{filename}' ({file_size} bytes) uploaded successfully by user {current_user.username}.")
+    return jsonify({'message': f'File {filename} uploaded successfully.'}), 200
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_entity_too_large(e):
+    """Answers bodies over MAX_CONTENT_LENGTH with JSON, matching the upload endpoint's errors."""
+    return jsonify({'error': 'File exceeds maximum size of 1GB.'}), 413
+
 # --- Database Initialization Command ---
 @app.cli.command('create_db')
 def create_db_command():
@@ -253,5 +613,37 @@ def create_db_command():
     app.logger.info(f"Ensured instance folder exists at: {instance_folder.resolve()}")
 
     with app.app_context():
-        db.create_all()
+        # One explicit transaction for all DDL: a single commit (and fsync) instead of one per table.
+        with db.engine.begin() as conn:
+            db.metadata.create_all(bind=conn)
+            # ix_user_email_lower cannot be built over rows differing only in case, and such rows
+            # would make login by email ambiguous; refuse (rolling back) until they are merged.
+            lowered = func.lower(User.email)
+            colliding = conn.execute(
+                select(User.email)
+                .where(lowered.in_(select(lowered).group_by(lowered).having(func.count() > 1)))
+                .order_by(lowered, User.email)
+            ).scalars().all()
+            if colliding:
+                raise click.ClickException(
+                    "These emails differ only in case and must be merged before the "
+                    f"case-insensitive email index can be created: {', '.join(colliding)}"
+                )
+            # create_all skips tables that already exist, so add indexes introduced since then.
+            # IF NOT EXISTS rather than checkfirst: SQLite reflection does not report expression indexes.
+            for index in User.__table__.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            # SQLite ignores page_size once a database is in WAL mode (the connect hook switches
+            # every connection to WAL), so apply it by leaving WAL, rebuilding with VACUUM, and
+            # switching back. This only does work the first time, or after SQLITE_PAGE_SIZE changes.
+            if conn.exec_driver_sql("PRAGMA page_size").scalar() != SQLITE_PAGE_SIZE:
+                conn.exec_driver_sql("PRAGMA journal_mode=DELETE").scalar()  # drain the result row so VACUUM can run
+                conn.exec_driver_sql(f"PRAGMA page_size={SQLITE_PAGE_SIZE}")
+                conn.exec_driver_sql("VACUUM")
+                conn.exec_driver_sql("PRAGMA journal_mode=WAL").scalar()
+            else:
+                # Fold the DDL into the main database file and reset the WAL to zero length. Not
+                # needed after a rebuild: VACUUM ran outside WAL, so there is nothing to fold in.
+                conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").all()
     print(f'Database tables created (or an attempt was made) for {app.config["SQLALCHEMY_DATABASE_URI"]}')
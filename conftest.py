@@ -0,0 +1,130 @@
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path, PurePosixPath
+from types import MappingProxyType
+
+import pytest
+
+import agent
+
+
+@pytest.fixture(scope='session', autouse=True)
+def tmpfs_workspace():
+    """
+    Points AGENT_FILES_WORKSPACE at a throwaway directory, on tmpfs where available. The directory
+    is unique per process, so pytest-xdist workers never share a workspace.
+    """
+    shm = Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        workspace_path = Path(tempfile.mkdtemp(prefix=f"agent_ws_{os.getpid()}_", dir=shm))
+    else:
+        workspace_path = Path(tempfile.mkdtemp(prefix="agent_ws_"))
+    # Modules that import the name directly hold their own copy, so patch every loaded one.
+    original = agent.AGENT_FILES_WORKSPACE
+    with pytest.MonkeyPatch.context() as mp:
+        for module in list(sys.modules.values()):
+            if getattr(module, "AGENT_FILES_WORKSPACE", None) is original:
+                mp.setattr(module, "AGENT_FILES_WORKSPACE", workspace_path)
+        yield workspace_path
+    shutil.rmtree(workspace_path, ignore_errors=True)
+
+# Files the read tests in TestAgentFileOps look up, seeded once into `reference_tree`.
+# Read-only, since every test (and the reference re-seed) shares this one module-level mapping.
+READ_TREE = MappingProxyType({
+    "file1.txt": b"This is file1 in root",
+    "common_name.txt": b"Root common",
+    "data/file2.txt": b"This is file2 in data",
+    "data/common_name.txt": b"Data common",
+    "another_dir/common_name.txt": b"This is common_name in another_dir",
+    "data/deeper/common_name.txt": b"This is common_name in data/deeper",
+    "report.txt": b"This is report.txt",
+    "report.md": b"This is report.md",
+    "data/report.txt": b"This is data/report.txt",
+    "archive/notes": b"Plain file named notes, no extension",
+    "archive/notes.txt": b"File named notes.txt",
+    "alpha.txt": b"Alpha text file",
+    "zebra.md": b"Zebra markdown file",
+})
+# READ_TREE's directories, parents before children, so read_tree can create each with one mkdir.
+READ_TREE_DIRS = tuple(sorted(
+    {parent.as_posix() for rel_path in READ_TREE for parent in PurePosixPath(rel_path).parents} - {"."},
+    key=lambda d: d.count("/"),
+))
+
+@pytest.fixture(scope='session')
+def reference_tree(tmpfs_workspace):
+    """
+    Seeds READ_TREE once into a pristine directory beside the workspace (so on the same
+    filesystem), and yields it with each file's (st_mtime_ns, st_size) as seeded.
+    """
+    reference = Path(tempfile.mkdtemp(prefix="agent_ref_", dir=tmpfs_workspace.parent))
+    _seed(reference, READ_TREE)
+    yield reference, _signatures(reference)
+    shutil.rmtree(reference, ignore_errors=True)
+
+@pytest.fixture
+def read_tree(tmpfs_workspace, reference_tree):
+    """Hard-links the reference tree into the workspace: one link() per file, no data written."""
+    reference, signatures = reference_tree
+    for directory in READ_TREE_DIRS:
+        os.mkdir(os.path.join(tmpfs_workspace, directory))
+    for rel_path in READ_TREE:
+        os.link(os.path.join(reference, rel_path), os.path.join(tmpfs_workspace, rel_path))
+    yield
+    # A test writing through a linked file writes into the reference too; re-seed what changed.
+    changed = [rel_path for rel_path, signature in _signatures(reference).items() if signature != signatures[rel_path]]
+    if changed:
+        for rel_path in changed:
+            os.unlink(os.path.join(reference, rel_path))
+        _seed(reference, {rel_path: READ_TREE[rel_path] for rel_path in changed})
+        signatures.update(_signatures(reference))
+
+@pytest.fixture(autouse=True) # Apply to every test
+def clean_workspace(tmpfs_workspace):
+    """Fixture to ensure the AGENT_FILES_WORKSPACE is empty after each test."""
+    yield # Test runs here
+    _fast_clear(tmpfs_workspace)
+
+def _seed(ws, tree):
+    """
+    Writes a flat {relative path: bytes} mapping straight into ws with os.open/os.write,
+    skipping write_text_file's path resolution, which tests do not need for their own setup.
+    """
+    for directory in sorted({os.path.dirname(rel_path) for rel_path in tree}, key=lambda d: d.count("/")):
+        if directory:
+            os.makedirs(os.path.join(ws, directory), exist_ok=True)
+    for rel_path, data in tree.items():
+        fd = os.open(os.path.join(ws, rel_path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+def _signatures(reference):
+    """Maps each READ_TREE path to its (st_mtime_ns, st_size) under reference."""
+    signatures = {}
+    for rel_path in READ_TREE:
+        st = os.stat(os.path.join(reference, rel_path))
+        signatures[rel_path] = (st.st_mtime_ns, st.st_size)
+    return signatures
+
+def _fast_clear(root):
+    """
+    Removes everything inside root, walking it iteratively with os.scandir so each entry costs
+    one stat from the DirEntry cache. Directories are removed afterwards, deepest first.
+    """
+    stack = [root]
+    directories = []
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    directories.append(entry.path)
+                else:
+                    os.unlink(entry.path)
+    # Every directory was discovered after its parent, so reversed order empties children first.
+    for directory in reversed(directories):
+        os.rmdir(directory)
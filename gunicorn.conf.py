@@ -0,0 +1,26 @@
+# Gunicorn configuration, loaded automatically from the working directory (/app in Docker).
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+# `workers` can be adjusted based on your VPS's CPU cores (e.g., 2 * num_cores + 1)
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+# The gthread worker gives each process a thread pool, so a slow /ask waiting on the
+# Gemini API no longer blocks every other request handled by that worker.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Import app.py once in the master and fork workers from it, so module-level setup
+# (Flask app, SQLAlchemy engine, tool declarations) is shared copy-on-write instead of
+# being repeated per worker. Nothing opens a network channel or DB connection at import.
+preload_app = True
+
+
+def post_fork(server, worker):
+    """Gives each worker its own DB connections and Gemini client, created after the fork."""
+    import app as flask_app
+
+    with flask_app.app.app_context():
+        # Drop any connection the master might have pooled; the child opens its own.
+        flask_app.db.engine.dispose(close=False)
+    # Warm the per-process model cache now rather than on the worker's first /ask.
+    flask_app._get_model()
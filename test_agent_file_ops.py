@@ -1,379 +1,80 @@
 import unittest
 from pathlib import Path
-import shutil
 import sys
 import os
-import io
 import pytest
 from unittest.mock import patch # New import for mocking
 
 # PyPDF2 imports for test PDF creation
 try:
-    from PyPDF2 import PdfWriter, PdfReader
-    from PyPDF2.errors import PdfReadError # For type hinting or direct use if needed
+    from PyPDF2 import PdfWriter
     PYPDF2_AVAILABLE_FOR_TEST_SETUP = True
 except ImportError:
     PYPDF2_AVAILABLE_FOR_TEST_SETUP = False
 
 
-# Ensure app and agent modules can be found
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.'))) # Assuming app.py and agent.py are in root
+# Ensure agent.py (in the repository root) can be found however the tests are launched.
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
 try:
-    from app import app, db, User # New import for Flask app, db, User
-    from agent import AGENT_FILES_WORKSPACE, read_text_file, write_text_file # AGENT_FILES_WORKSPACE is crucial
+    import agent
+    from agent import AGENT_FILES_WORKSPACE, read_text_file, write_text_file
 except ImportError as e:
-    print(f"Critical import error for Flask app or agent components: {e}")
-    # This is a critical failure for the new tests
-    raise
+    raise ModuleNotFoundError(f"agent.py must be importable from {os.path.dirname(os.path.abspath(__file__))}: {e}") from e
 
-# Add the parent directory of 'agent.py' to the Python path
-# This assumes 'agent.py' is in the root of the repository where the tests are run from.
-# If agent.py is in a subdirectory, this might need adjustment.
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
 
-try:
-    import agent
-    from agent import read_text_file, write_text_file
-except ImportError as e:
-    print(f"Failed to import agent module or its functions: {e}")
-    print("Make sure agent.py is in the same directory or PYTHONPATH is set correctly.")
-    # To help diagnose, let's see current sys.path and cwd
-    print(f"Current sys.path: {sys.path}")
-    print(f"Current working directory: {os.getcwd()}")
-    # List files in current directory to see if agent.py is there
-    print(f"Files in CWD: {os.listdir('.')}")
-    # If agent.py is in a subdir like 'src', then one might do:
-    # sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
-    # Or ensure the test runner (e.g. VSCode) is configured to run from the project root.
-    # For the purpose of this tool, assuming agent.py is at the root.
-    # The original 'raise' might be too aggressive if only unittest tests were intended to run.
-    # However, for the new pytest tests, app and agent imports are vital.
-    # We'll let it be, as a failure to import these is a failure for the new tests.
-    pass # Keep the original try-except for agent, but don't raise if only agent parts fail for old tests.
-
-
-# --- Pytest Fixtures for Flask App Testing ---
-
-@pytest.fixture(scope='module')
-def app_with_db():
-    """Fixture to initialize the Flask app with a test configuration and in-memory DB."""
-    # Ensure app.py and agent.py are in the root or sys.path is correctly configured
-    app.config.update({
-        "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
-        "WTF_CSRF_ENABLED": False,
-        "SECRET_KEY": "test_secret_key_for_pytest",
-        "LOGIN_DISABLED": False, # Ensure login is enabled for auth tests
-        # Use a separate test workspace for uploads to avoid conflicts with agent's own tests
-        # This requires agent.AGENT_FILES_WORKSPACE to be patchable or configurable for tests.
-        # For now, we will use the actual AGENT_FILES_WORKSPACE and clean it.
-    })
-
-    with app.app_context():
-        db.create_all()
-        yield app # Provide the app object
-        db.session.remove() # Ensure session is properly closed
-        db.drop_all()
-        db.engine.dispose() # Dispose of the engine to release connections
-
-@pytest.fixture(scope='module')
-def test_user_data():
-    return {'email': 'pytestuser@example.com', 'password': 'password123', 'username': 'pytestuser'}
-
-@pytest.fixture(scope='function') # Function scope to ensure clean user for each test if needed
-def logged_in_client(app_with_db, test_user_data):
-    """Fixture to provide a test client with a logged-in user."""
-    with app_with_db.app_context():
-        # Check if user already exists to prevent unique constraint errors if re-used across tests
-        user = User.query.filter_by(email=test_user_data['email']).first()
-        if not user:
-            user = User(username=test_user_data['username'], email=test_user_data['email'])
-            user.set_password(test_user_data['password'])
-            db.session.add(user)
-            db.session.commit()
-        
-        # Log in the user via test client
-        # The initial login should happen outside the 'with client:' block if client is yielded directly
-    
-    # This client is created outside the app_context of user creation, but uses the app from app_with_db
-    # which should share the same configuration.
-    with app_with_db.test_client() as client:
-        with client.session_transaction() as sess: # Ensure session is handled correctly
-            # To log in, we typically post to the login route.
-            # Or, for more direct control in tests, we can simulate login by setting session variables
-            # if Flask-Login's internal workings are well understood.
-            # However, posting to /login is more robust as it uses the app's own logic.
-            pass # Placeholder for login logic
-
-        # Perform login
-        login_rv = client.post('/login', data={
-            'email': test_user_data['email'],
-            'password': test_user_data['password']
-        }, follow_redirects=True)
-        
-        assert login_rv.status_code == 200 # Check login success
-        # assert b'Logout' in login_rv.data # A more robust check for successful login page content
-
-        yield client # Client is now logged in
-
-        # Clean up: logout (optional, as client is fresh per test) and delete user
-        # client.get('/logout', follow_redirects=True) # Optional: logout
-        with app_with_db.app_context(): # Need app context for DB operations
-            user_to_delete = User.query.filter_by(email=test_user_data['email']).first()
-            if user_to_delete:
-                db.session.delete(user_to_delete)
-                db.session.commit()
-
-
-@pytest.fixture
-def unauthenticated_client(app_with_db):
-    """Fixture to provide a test client that is not logged in."""
-    with app_with_db.test_client() as client:
-        yield client
-
-@pytest.fixture(autouse=True) # Apply to all test methods in this file
-def clean_workspace():
-    """Fixture to ensure the AGENT_FILES_WORKSPACE is clean before and after tests."""
-    workspace_path = Path(AGENT_FILES_WORKSPACE)
-    
-    # Clean before test
-    if workspace_path.exists():
-        for item in workspace_path.iterdir():
-            if item.is_file():
-                item.unlink()
-            elif item.is_dir():
-                shutil.rmtree(item)
-    else:
-        workspace_path.mkdir(parents=True, exist_ok=True)
-    
-    yield # Test runs here
-
-    # Clean after test (optional, if setup cleans before each test, this might be redundant but safe)
-    # This is more like a "module" level cleanup if not autouse=True per test.
-    # For autouse=True, this runs after each test.
-    if workspace_path.exists():
-        for item in workspace_path.iterdir():
-            if item.is_file():
-                item.unlink()
-            elif item.is_dir():
-                shutil.rmtree(item)
-
-# --- Pytest Test Functions for File Upload ---
-
-def test_upload_txt_file_success(logged_in_client):
-    """Test successful upload of a .txt file."""
-    file_content = b"This is a test text file for upload."
-    file_name = "test_upload.txt"
-    data = {'file': (io.BytesIO(file_content), file_name)}
-
-    response = logged_in_client.post('/upload_file', data=data, content_type='multipart/form-data')
-
-    assert response.status_code == 200
-    json_response = response.get_json()
-    assert json_response['message'] == f'File {file_name} uploaded successfully.'
-    
-    file_path = Path(AGENT_FILES_WORKSPACE) / file_name
-    assert file_path.exists()
-    assert file_path.read_bytes() == file_content
-    # Cleanup is handled by clean_workspace fixture
-
-def test_upload_pdf_file_success(logged_in_client):
-    """Test successful upload of a .pdf file."""
-    file_content = b"%PDF-1.4 test content for PDF upload"
-    file_name = "test_upload.pdf"
-    data = {'file': (io.BytesIO(file_content), file_name)}
-
-    response = logged_in_client.post('/upload_file', data=data, content_type='multipart/form-data')
-
-    assert response.status_code == 200
-    json_response = response.get_json()
-    assert json_response['message'] == f'File {file_name} uploaded successfully.'
-    
-    file_path = Path(AGENT_FILES_WORKSPACE) / file_name
-    assert file_path.exists()
-    assert file_path.read_bytes() == file_content
-    # Cleanup is handled by clean_workspace fixture
-
-def test_upload_invalid_extension(logged_in_client):
-    """Test upload of a file with an invalid extension."""
-    file_content = b"This is an executable file."
-    file_name = "test_app.exe"
-    data = {'file': (io.BytesIO(file_content), file_name)}
-
-    response = logged_in_client.post('/upload_file', data=data, content_type='multipart/form-data')
-
-    assert response.status_code == 400
-    json_response = response.get_json()
-    assert "File type not allowed" in json_response['error']
-    
-    file_path = Path(AGENT_FILES_WORKSPACE) / file_name
-    assert not file_path.exists()
-
-def test_upload_file_too_large(logged_in_client, monkeypatch):
-    """Test upload of a file that exceeds MAX_FILE_SIZE."""
-    original_max_size = app.config.get('MAX_FILE_SIZE', 1 * 1024 * 1024 * 1024) # Default from app.py if not in config
-    
-    # Mock MAX_FILE_SIZE in the app's configuration for this test
-    # For this to work, app.py should ideally use app.config['MAX_FILE_SIZE']
-    # If app.py uses a global constant MAX_FILE_SIZE, this won't work directly.
-    # The prompt mentioned app.MAX_FILE_SIZE. Let's assume it's a direct attribute or can be monkeypatched.
-    # We are testing the route in app.py, so we need to affect *that* app instance.
-    # The `app` object imported is the actual app instance.
-    # The constants `ALLOWED_EXTENSIONS` and `MAX_FILE_SIZE` were added directly to app.py, not app.config
-    # So, we need to monkeypatch the global constant in the `app` module (which is `app.py` effectively).
-    
-    monkeypatch.setattr('app.MAX_FILE_SIZE', 10) # Set max size to 10 bytes for this test
-
-    file_content = b"This file is larger than 10 bytes."
-    file_name = "large_file.txt"
-    data = {'file': (io.BytesIO(file_content), file_name)}
-
-    response = logged_in_client.post('/upload_file', data=data, content_type='multipart/form-data')
-
-    assert response.status_code == 400 # Based on app.py, it should be 400
-    json_response = response.get_json()
-    assert "File exceeds maximum size" in json_response['error']
-    
-    file_path = Path(AGENT_FILES_WORKSPACE) / file_name
-    assert not file_path.exists()
-    
-    # Restore original value if necessary (monkeypatch does this automatically for `setattr`)
-    # monkeypatch.undo() # Not strictly needed for setattr if monkeypatch fixture is used as arg
-
-def test_upload_no_file_part(logged_in_client):
-    """Test upload request with no file part."""
-    response = logged_in_client.post('/upload_file', data={}, content_type='multipart/form-data')
-    
-    assert response.status_code == 400
-    json_response = response.get_json()
-    assert json_response['error'] == 'No file part in the request.'
-
-def test_upload_no_selected_file(logged_in_client):
-    """Test upload request with no selected file (empty filename)."""
-    data = {'file': (io.BytesIO(b""), '')} # Empty filename
-    response = logged_in_client.post('/upload_file', data=data, content_type='multipart/form-data')
-
-    assert response.status_code == 400
-    json_response = response.get_json()
-    assert json_response['error'] == 'No selected file.'
-
-def test_upload_unauthenticated(unauthenticated_client):
-    """Test upload attempt by an unauthenticated user."""
-    file_content = b"This is a test text file."
-    file_name = "test_unauth.txt"
-    data = {'file': (io.BytesIO(file_content), file_name)}
-
-    response = unauthenticated_client.post('/upload_file', data=data, content_type='multipart/form-data')
-    
-    # Flask-Login usually redirects to login_view on @login_required failure
-    assert response.status_code == 302 
-    # Check if it redirects to the login page (or a page containing '/login')
-    assert '/login' in response.headers['Location']
+# (requested path, expected content) pairs answered from READ_TREE; reads never mutate the
+# workspace, so TestAgentFileOps.test_all_reads checks them all against one linked tree.
+READ_CASES = [
+    ("file1.txt", "This is file1 in root"),                                    # by name, in the root
+    ("data/file2.txt", "This is file2 in data"),                               # by relative path
+    ("common_name.txt", "Root common"),                                        # ambiguous name: shallowest wins
+    ("data/deeper/common_name.txt", "This is common_name in data/deeper"),     # explicit deeper path
+    ("alpha", "Alpha text file"),                                              # extension-agnostic name
+    ("report", "This is report.md"),                                           # agnostic: shallowest, then path order
+    ("report.md", "This is report.md"),                                        # exact name with extension
+    ("report.txt", "This is report.txt"),
+    ("notes", "File named notes.txt"),                                         # agnostic search skips 'archive/notes'
+    ("archive/notes", "Plain file named notes, no extension"),                 # exact path without extension
+]
 
 
 # --- Existing Unittest Class ---
+@pytest.mark.usefixtures('read_tree')
 class TestAgentFileOps(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        # This check is to ensure agent and its AGENT_FILES_WORKSPACE are loaded
-        # before we try to patch it.
-        if 'agent' not in sys.modules:
-            raise unittest.SkipTest("Agent module not loaded, skipping tests.")
-        cls.original_workspace = agent.AGENT_FILES_WORKSPACE
-        cls.test_workspace = Path("agent_files_test_workspace_unique_read").resolve()
-        # This class uses its own test_workspace, which is fine.
-        # The new pytest tests will use the actual AGENT_FILES_WORKSPACE
-        # and the `clean_workspace` fixture will manage that.
-        # It's important that agent.AGENT_FILES_WORKSPACE is not globally patched by these
-        # unittest tests IF pytest tests are running in the same session and relying on the
-        # original AGENT_FILES_WORKSPACE value.
-        # For now, we assume pytest runs these separately or the patching is contained.
-        # The original setUpClass patches agent.AGENT_FILES_WORKSPACE. This could be an issue.
-        # Let's remove the patching of agent.AGENT_FILES_WORKSPACE for now to avoid conflicts.
-        # The agent tests should ideally use a passed-in workspace path if possible,
-        # or mock it carefully.
-        # For now, let's assume the unittests will also use the default AGENT_FILES_WORKSPACE
-        # and rely on clean_workspace fixture. This simplifies things.
-        # cls.original_workspace = agent.AGENT_FILES_WORKSPACE # No longer needed if not patching
-        # cls.test_workspace = Path("agent_files_test_workspace_unique_read").resolve()
-        cls.test_workspace = Path(AGENT_FILES_WORKSPACE) # Use the main one, cleaned by pytest fixture
-        # agent.AGENT_FILES_WORKSPACE = cls.test_workspace # Don't patch globally
-
-    @classmethod
-    def tearDownClass(cls):
-        # agent.AGENT_FILES_WORKSPACE = cls.original_workspace # No longer needed
-        # if cls.test_workspace.exists() and str(cls.test_workspace) != str(Path(AGENT_FILES_WORKSPACE)):
-            # shutil.rmtree(cls.test_workspace) # Only remove if it was a custom one
-        pass # Cleanup handled by pytest fixture 'clean_workspace'
-
-    def setUp(self):
-        # Workspace is cleaned by `clean_workspace` fixture now.
-        # self.test_workspace.mkdir(parents=True, exist_ok=True) # Not needed if clean_workspace runs
-
-        # Populate with files using the agent's write_text_file for consistency
-        # These files will be created in the actual AGENT_FILES_WORKSPACE
-        Path(self.test_workspace, "data").mkdir(parents=True, exist_ok=True)
-        Path(self.test_workspace, "another_dir").mkdir(parents=True, exist_ok=True)
-        Path(self.test_workspace, "data/deeper").mkdir(parents=True, exist_ok=True)
-        Path(self.test_workspace, "archive").mkdir(parents=True, exist_ok=True)
-
-        write_text_file("file1.txt", "This is file1 in root")
-        write_text_file("common_name.txt", "Root common")
-
-        write_text_file("data/file2.txt", "This is file2 in data")
-        write_text_file("data/common_name.txt", "Data common")
-
-        write_text_file("another_dir/common_name.txt", "This is common_name in another_dir")
-        write_text_file("data/deeper/common_name.txt", "This is common_name in data/deeper")
-
-        write_text_file("report.txt", "This is report.txt")
-        write_text_file("report.md", "This is report.md")
-        write_text_file("data/report.txt", "This is data/report.txt")
-
-        write_text_file("archive/notes", "Plain file named notes, no extension")
-        write_text_file("archive/notes.txt", "File named notes.txt")
-        
-        write_text_file("alpha.txt", "Alpha text file")
-        write_text_file("zebra.md", "Zebra markdown file")
-
+        # The read_tree fixture populates the agent's own workspace, so no patching is needed.
+        cls.test_workspace = Path(AGENT_FILES_WORKSPACE)
 
     def tearDown(self):
         # Cleanup is handled by the `clean_workspace` pytest fixture
         pass
 
-    def test_read_file_by_name_in_root(self):
-        content = read_text_file("file1.txt")
-        self.assertEqual(content, "This is file1 in root")
-
-    def test_read_file_by_relative_path(self):
-        content = read_text_file("data/file2.txt")
-        self.assertEqual(content, "This is file2 in data")
-
-    def test_read_file_by_name_ambiguous_shallowest_first(self):
-        # common_name.txt exists in root, data/, and another_dir/
-        # _resolve_safe_path should pick the one in root (shallowest)
-        content = read_text_file("common_name.txt")
-        self.assertEqual(content, "Root common")
-
-    def test_read_file_by_name_specific_deeper_path(self):
-        content = read_text_file("data/deeper/common_name.txt")
-        self.assertEqual(content, "This is common_name in data/deeper")
+    def test_all_reads(self):
+        for rel_path, expected in READ_CASES:
+            with self.subTest(rel_path=rel_path):
+                self.assertEqual(read_text_file(rel_path), expected)
 
     def test_read_non_existent_file_by_name(self):
         result = read_text_file("nonexistentfile.txt")
-        self.assertIn("Error: File not found", result)
+        self.assertTrue(result.startswith("Error: File not found"), result)
 
     def test_read_non_existent_file_by_path(self):
         result = read_text_file("data/nonexistentfile.txt")
-        self.assertIn("Error: File not found", result)
+        self.assertTrue(result.startswith("Error: File not found"), result)
+
+    def test_read_non_existent_nested_path_creates_no_directories(self):
+        result = read_text_file("missing_dir/inner/file.txt")
+        self.assertTrue(result.startswith("Error: File not found"), result)
+        self.assertFalse((self.test_workspace / "missing_dir").exists())
 
     def test_read_file_outside_workspace_attempt_simple_traverse(self):
         # This path will be resolved to AGENT_FILES_WORKSPACE/../../../etc/passwd
         # The security check in _resolve_safe_path should prevent it.
         result = read_text_file("../../../etc/passwd")
-        self.assertIn("Error: Invalid or disallowed file path", result)
+        self.assertTrue(result.startswith("Error: Invalid or disallowed file path"), result)
 
     def test_read_file_outside_workspace_attempt_absolute(self):
         # Absolute paths are not explicitly checked before _resolve_safe_path,
@@ -382,8 +83,13 @@ class TestAgentFileOps(unittest.TestCase):
         # If relative_filepath is absolute like /etc/passwd, base_path / "/etc/passwd" becomes "/etc/passwd".
         # Then the security check (base_path not in resolved_path.parents) should catch it.
         result = read_text_file("/etc/passwd")
-        self.assertIn("Error: Invalid or disallowed file path", result)
-        
+        self.assertTrue(result.startswith("Error: Invalid or disallowed file path"), result)
+
+    def test_read_empty_or_dot_path_rejected(self):
+        # Neither an empty path nor '.' names a file; both are rejected before any resolution.
+        self.assertTrue(read_text_file("").startswith("Error: Invalid or disallowed file path"))
+        self.assertTrue(read_text_file(".").startswith("Error: Invalid or disallowed file path"))
+
     def test_read_directory_instead_of_file(self):
         # Attempt to read a directory as if it were a file
         # 'data' is a directory created in setUp
@@ -391,80 +97,49 @@ class TestAgentFileOps(unittest.TestCase):
         # The exact error message might depend on OS and Python version,
         # but it should indicate it's not a file or not found as a file.
         # Current `read_text_file` checks `safe_path.is_file()`.
-        self.assertIn("Error: File not found or is not a regular file", result)
+        self.assertTrue(result.startswith("Error: File not found or is not a regular file"), result)
+
+    def test_list_files_reflects_new_entries(self):
+        before = agent.list_files_in_workspace()
+        self.assertIn("file1.txt", before)
+        self.assertNotIn("fresh.txt", before)
+
+        # Created behind the agent's back, so only the mtime check can notice it.
+        (self.test_workspace / "fresh.txt").write_text("new")
+        self.assertIn("fresh.txt", agent.list_files_in_workspace())
+
+        write_text_file("fresh_via_tool.txt", "new")
+        self.assertIn("fresh_via_tool.txt", agent.list_files_in_workspace())
+
+    def test_in_progress_uploads_are_hidden(self):
+        # Partial uploads stream into '.upload-*.part' files; neither the listing nor a
+        # bare-name lookup may surface them.
+        (self.test_workspace / ".upload-abc123.part").write_text("partial")
+        (self.test_workspace / "data/.upload-def456.part").write_text("partial")
+        self.assertNotIn(".upload-abc123.part", agent.list_files_in_workspace())
+        self.assertTrue(read_text_file(".upload-def456.part").startswith("Error: File not found"))
 
     # --- Tests for Extension-Agnostic Search ---
 
-    def test_read_file_by_name_extension_agnostic_finds_txt(self):
-        # To make this predictable, ensure only one 'report.*' exists in root for this specific search pattern.
-        # Here, we rely on the setUp creating both report.txt and report.md.
-        # The current _resolve_safe_path logic with rglob("report.*") will get a list.
-        # If report.txt and report.md are at the same depth, the one rglob yields first is chosen.
-        # Let's assume rglob might give .md before .txt or vice-versa. The key is it finds *a* report.
-        # The _resolve_safe_path sorts by depth, then takes first from rglob's list.
-        # This test will verify that *one* of them matching "report.*" is found.
-        # To be more specific, let's test with "alpha" which only has "alpha.txt"
-        content = read_text_file("alpha") 
-        self.assertEqual(content, "Alpha text file")
-
-    def test_read_file_by_name_extension_agnostic_multiple_extensions(self):
-        # report.txt and report.md exist in the root.
-        # Searching for "report" should find one of them.
-        # The current implementation of _resolve_safe_path uses rglob("report.*").
-        # The order from rglob for same-depth files is OS/filesystem dependent.
-        # We sort by len(parts) so depth is prioritized. For same depth, it's rglob's order.
-        # Let's check if it returns either of the expected contents.
-        content = read_text_file("report")
-        self.assertIn(content, ["This is report.txt", "This is report.md"])
-        # To make it more robust, we can check the log for what it found.
-        # For example, the log "Found multiple files: ['report.md', 'report.txt'] for pattern 'report.*'. Selected 'report.md'..."
-        # However, asserting log content is brittle.
-        # For now, accepting either is sufficient to show the mechanism works.
-
-    def test_read_file_by_name_agnostic_prefers_shallower_depth(self):
-        # report.txt (content: "This is report.txt") is in the root.
-        # data/report.txt (content: "This is data/report.txt") is in a subdirectory.
-        # Searching for "report" should find the root one.
-        content = read_text_file("report")
-        # Based on current rglob behavior and sort by depth, root file should be preferred.
-        # If both root/report.txt and root/report.md exist, it will pick one of them.
-        # We need to ensure the "Root report.txt" is picked over "Data report.txt".
-        # The setUp creates "This is report.txt" and "This is report.md" in root.
-        # Based on rglob behavior and sort by depth, a root file should be preferred.
-        # The log from the failing test showed: "Found multiple files: ['report.md', 'report.txt', 'data/report.txt'] for pattern 'report.*'. Selected 'report.md' based on depth/order."
-        # This means 'report.md' was selected.
-        self.assertEqual(content, "This is report.md")
-
-    def test_read_file_by_name_exact_with_extension_still_works(self):
-        content = read_text_file("report.md")
-        self.assertEqual(content, "This is report.md")
-        
-        content_txt = read_text_file("report.txt")
-        self.assertEqual(content_txt, "This is report.txt")
-
-    def test_read_file_agnostic_finds_file_with_extension_when_no_exact_match_no_ext_exists(self):
-        # We have 'archive/notes' (no ext) and 'archive/notes.txt'.
-        # Searching for "notes" (relative to workspace root, so effectively "archive/notes")
-        # The _resolve_safe_path if given "notes" will search for "notes.*" if "notes" is not found directly.
-        # However, read_text_file("notes") means a simple filename "notes".
-        # _resolve_safe_path will do rglob("notes.*") from the workspace root.
-        # It should find "archive/notes.txt".
-        # It will NOT find "archive/notes" with "notes.*" pattern.
-        content = read_text_file("notes")
-        self.assertEqual(content, "File named notes.txt")
-
-    def test_read_file_exact_name_no_extension_found_if_no_ext_alternatives(self):
-        # This test is to see if we can read a file that has no extension by providing its exact name.
-        # We have `archive/notes` (content: "Plain file named notes, no extension").
-        # When we call `read_text_file("archive/notes")`, it's a path, not a simple filename.
-        # So, _resolve_safe_path will use the exact path.
-        content = read_text_file("archive/notes")
-        self.assertEqual(content, "Plain file named notes, no extension")
-        
     def test_read_file_by_name_agnostic_non_existent(self):
         # Test reading a file by name (agnostic search) that doesn't exist in any form
         result = read_text_file("non_existent_agnostic_search")
-        self.assertIn("Error: File not found", result)
+        self.assertTrue(result.startswith("Error: File not found"), result)
+
+    def test_read_file_by_name_sees_files_added_outside_the_agent(self):
+        # A lookup builds the name index; a file then dropped into a nested directory
+        # (as an upload or a shell would) must still be found by bare name.
+        self.assertTrue(read_text_file("late_arrival").startswith("Error: File not found"))
+        Path(self.test_workspace, "data/deeper/late_arrival.txt").write_text("Arrived late")
+        self.assertEqual(read_text_file("late_arrival"), "Arrived late")
+
+    def test_read_file_by_name_follows_symlinks_inside_the_workspace(self):
+        # A symlinked file is found by its bare name when its target stays in the workspace;
+        # one pointing outside is not indexed, so the lookup falls through to "not found".
+        os.symlink(self.test_workspace / "data/file2.txt", self.test_workspace / "data/deeper/linked.txt")
+        os.symlink("/etc/hostname", self.test_workspace / "data/deeper/escape.txt")
+        self.assertEqual(read_text_file("linked"), "This is file2 in data")
+        self.assertTrue(read_text_file("escape.txt").startswith("Error: File not found"))
 
     # --- Tests for PDF Handling ---
 
@@ -599,7 +274,7 @@ class TestAgentFileOps(unittest.TestCase):
     def test_read_corrupted_pdf(self):
         """Test reading a file with .pdf extension that is not a valid PDF."""
         pdf_name = "test_corrupted.pdf"
-        write_text_file(pdf_name, "This is not a PDF file, just plain text.")
+        (self.test_workspace / pdf_name).write_bytes(b"This is not a PDF file, just plain text.")
         
         content = read_text_file(pdf_name)
         expected_message = f"Error: Could not read PDF file '{pdf_name}'. The file may be corrupted or not a valid PDF."
@@ -610,11 +285,18 @@ class TestAgentFileOps(unittest.TestCase):
         """Test that reading normal text files still works as expected."""
         txt_name = "test_normal.txt"
         expected_text = "Hello text world."
-        write_text_file(txt_name, expected_text)
+        (self.test_workspace / txt_name).write_bytes(expected_text.encode())
 
         content = read_text_file(txt_name)
         self.assertEqual(content, expected_text)
 
+    def test_write_overwrites_and_creates_parent_dirs(self):
+        """Test that writes create missing directories and truncate existing content."""
+        write_text_file("new_dir/nested/unicode.txt", "héllo wörld " * 1000)
+        result = write_text_file("new_dir/nested/unicode.txt", "short ✓")
+        self.assertTrue(result.startswith("Success"))
+        self.assertEqual(read_text_file("new_dir/nested/unicode.txt"), "short ✓")
+
 
     @patch('agent.PYPDF2_INSTALLED', False)
     def test_read_pdf_with_pypdf2_not_installed(self, mock_pypdf2_installed_flag):
@@ -0,0 +1,439 @@
+import io
+import os
+import zlib
+from unittest.mock import patch
+
+import pytest
+
+# Hash passwords with the cheapest Argon2 parameters: every login in these tests pays for a verify.
+os.environ.setdefault('ARGON2_TIME_COST', '1')
+os.environ.setdefault('ARGON2_MEMORY_COST', '8')
+# An in-memory database, so tests never touch instance/users.db.
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import agent
+from app import app, db, User
+
+# The account every logged-in client acts as.
+_USER = {'email': 'pytestuser@example.com', 'password': 'password123', 'username': 'pytestuser'}
+
+
+# --- Pytest Fixtures for Flask App Testing ---
+
+@pytest.fixture(scope='session')
+def app_with_db():
+    """Fixture to initialize the Flask app with a test configuration and in-memory DB."""
+    # Ensure app.py and agent.py are in the root or sys.path is correctly configured
+    app.config.update({
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "SECRET_KEY": "test_secret_key_for_pytest",
+        "LOGIN_DISABLED": False, # Ensure login is enabled for auth tests
+    })
+
+    with app.app_context():
+        db.create_all()
+    # The app context is not held open across the yield: requests would otherwise reuse it,
+    # and Flask-Login's cached user on `g` would leak between test clients.
+    yield app # Provide the app object
+    with app.app_context():
+        db.session.remove() # Ensure session is properly closed
+        db.drop_all()
+        db.engine.dispose() # Dispose of the engine to release connections
+
+@pytest.fixture(scope='session')
+def test_user(app_with_db):
+    """Creates the shared test user once, so its password is hashed once per session."""
+    with app_with_db.app_context():
+        user = User(username=_USER['username'], email=_USER['email'])
+        user.set_password(_USER['password'])
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    yield user_id
+    with app_with_db.app_context():
+        User.query.filter_by(id=user_id).delete()
+        db.session.commit()
+
+@pytest.fixture(scope='function')
+def logged_in_client(app_with_db, test_user):
+    """Fixture to provide a test client with a logged-in user."""
+    with app_with_db.test_client() as client:
+        # Forge Flask-Login's session keys instead of POSTing to /login, which would verify the password.
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(test_user)
+            sess['_fresh'] = True
+        yield client
+
+
+@pytest.fixture
+def unauthenticated_client(app_with_db):
+    """Fixture to provide a test client that is not logged in."""
+    with app_with_db.test_client() as client:
+        yield client
+
+def _same(path, expected):
+    """Checks a stored upload against the sent bytes: size first (one stat), then CRC32."""
+    return os.path.getsize(path) == len(expected) and zlib.crc32(path.read_bytes()) == zlib.crc32(expected)
+
+# --- Pytest Test Functions for the create_db Command ---
+
+def test_create_db_refuses_emails_differing_only_in_case(app_with_db):
+    """Test that create_db names case-colliding emails instead of failing on the unique index."""
+    with app.app_context():
+        with db.engine.begin() as conn:
+            # Rows from before emails were normalized, which the index would now reject.
+            conn.exec_driver_sql("DROP INDEX ix_user_email_lower")
+            conn.exec_driver_sql("INSERT INTO user (username, email) VALUES ('foo1', 'Foo@x.com'), ('foo2', 'foo@x.com')")
+    try:
+        result = app.test_cli_runner().invoke(args=['create_db'])
+        assert result.exit_code != 0
+        assert 'Foo@x.com, foo@x.com' in result.output
+        assert isinstance(result.exception, SystemExit)  # a ClickException exit, not an IntegrityError
+    finally:
+        with app.app_context():
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql("DELETE FROM user WHERE username IN ('foo1', 'foo2')")
+                conn.exec_driver_sql("CREATE UNIQUE INDEX ix_user_email_lower ON user (lower(email))")
+
+# --- Pytest Test Functions for JSON Serialization ---
+
+def test_json_provider_sorts_and_stringifies_keys(app_with_db):
+    """Test that the orjson provider matches json.dumps on sort_keys and non-str keys."""
+    payload = {'b': 1, 2: 'two', 'a': 0}
+    assert app.json.dumps(payload) == '{"2":"two","a":0,"b":1}'
+    with app.test_request_context():
+        assert app.json.response(payload).get_data() == b'{"2":"two","a":0,"b":1}\n'
+
+# --- Pytest Test Functions for Password Hashing ---
+
+def test_password_hash_uses_argon2():
+    """Test that new passwords are stored as Argon2id hashes and verify correctly."""
+    user = User(username='hashuser', email='hash@example.com')
+    user.set_password('s3cret-pass')
+    assert user.password_hash.startswith('$argon2id$')
+    assert user.check_password('s3cret-pass')
+    assert not user.check_password('wrong-pass')
+
+def test_password_hash_follows_argon2_config(monkeypatch):
+    """Test that ARGON2_* changes made in app.config after import take effect."""
+    monkeypatch.setitem(app.config, 'ARGON2_MEMORY_COST', 16)
+    user = User(username='costuser', email='cost@example.com')
+    user.set_password('s3cret-pass')
+    assert '$m=16,' in user.password_hash
+    assert user.check_password('s3cret-pass')
+
+def test_password_check_accepts_legacy_werkzeug_hash():
+    """Test that hashes created before the Argon2 switch still verify."""
+    from werkzeug.security import generate_password_hash
+    user = User(username='legacyuser', email='legacy@example.com',
+                password_hash=generate_password_hash('old-pass', method='pbkdf2:sha256:1000'))
+    assert user.check_password('old-pass')
+    assert not user.check_password('wrong-pass')
+
+def test_login_upgrades_legacy_hash_to_argon2(unauthenticated_client):
+    """Test that a successful login rehashes a legacy Werkzeug hash, and only then."""
+    from werkzeug.security import generate_password_hash
+    with unauthenticated_client.application.app_context():
+        db.session.add(User(username='upgradeuser', email='upgrade@example.com',
+                            password_hash=generate_password_hash('old-pass', method='pbkdf2:sha256:1000')))
+        db.session.commit()
+
+    try:
+        response = unauthenticated_client.post('/login', data={'email': 'upgrade@example.com', 'password': 'old-pass'})
+        assert response.status_code == 302
+        with unauthenticated_client.application.app_context():
+            user = User.query.filter_by(email='upgrade@example.com').first()
+            assert user.password_hash.startswith('$argon2id$')
+            assert not user.password_needs_rehash()
+    finally:
+        with unauthenticated_client.application.app_context():
+            User.query.filter_by(email='upgrade@example.com').delete()
+            db.session.commit()
+
+# --- Pytest Test Functions for Registration ---
+
+def test_register_creates_user(unauthenticated_client):
+    """Test that a fresh registration inserts exactly one verifiable user."""
+    form = {'username': 'freshuser', 'email': 'fresh@example.com',
+            'password': 'password123', 'confirm_password': 'password123'}
+    try:
+        response = unauthenticated_client.post('/register', data=form)
+        assert response.status_code == 302
+        assert '/login' in response.headers['Location']
+        with unauthenticated_client.application.app_context():
+            users = User.query.filter_by(email='fresh@example.com').all()
+            assert len(users) == 1
+            assert users[0].username == 'freshuser'
+            assert users[0].check_password('password123')
+    finally:
+        with unauthenticated_client.application.app_context():
+            User.query.filter_by(email='fresh@example.com').delete()
+            db.session.commit()
+
+def test_register_rejects_duplicate_email_and_username(unauthenticated_client):
+    """Test that registration reports which unique field is already taken."""
+    with unauthenticated_client.application.app_context():
+        existing = User(username='takenuser', email='taken@example.com')
+        existing.set_password('password123')
+        db.session.add(existing)
+        db.session.commit()
+
+    try:
+        form = {'username': 'someoneelse', 'email': 'taken@example.com',
+                'password': 'password123', 'confirm_password': 'password123'}
+        response = unauthenticated_client.post('/register', data=form)
+        assert response.status_code == 302
+        assert '/login' in response.headers['Location']
+
+        # Emails are case-insensitive: a differently-cased address is the same account.
+        form.update(email='  TAKEN@Example.com')
+        response = unauthenticated_client.post('/register', data=form)
+        assert response.status_code == 302
+        assert '/login' in response.headers['Location']
+
+        form.update(username='takenuser', email='another@example.com')
+        response = unauthenticated_client.post('/register', data=form)
+        assert response.status_code == 302
+        assert '/register' in response.headers['Location']
+    finally:
+        with unauthenticated_client.application.app_context():
+            User.query.filter_by(email='taken@example.com').delete()
+            db.session.commit()
+
+# --- Pytest Test Functions for File Upload ---
+
+def test_upload_txt_file_success(logged_in_client):
+    """Test successful upload of a .txt file."""
+    file_content = b"This is a test text file for upload."
+    file_name = "test_upload.txt"
+    data = {'file': (io.BytesIO(file_content), file_name)}
+
+    response = logged_in_client.post('/upload_file', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    json_response = response.get_json()
+    assert json_response['message'] == f'File {file_name} uploaded successfully.'
+    
+    file_path = agent.AGENT_FILES_WORKSPACE / file_name
+    assert file_path.exists()
+    assert _same(file_path, file_content)
+    # Cleanup is handled by clean_workspace fixture
+
+def test_upload_pdf_file_success(logged_in_client):
+    """Test successful upload of a .pdf file."""
+    file_content = b"%PDF-1.4 test content for PDF upload"
+    file_name = "test_upload.pdf"
+    data = {'file': (io.BytesIO(file_content), file_name)}
+
+    response = logged_in_client.post('/upload_file', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    json_response = response.get_json()
+    assert json_response['message'] == f'File {file_name} uploaded successfully.'
+    
+    file_path = agent.AGENT_FILES_WORKSPACE / file_name
+    assert file_path.exists()
+    assert _same(file_path, file_content)
+    # Cleanup is handled by clean_workspace fixture
+
+def test_upload_invalid_extension(logged_in_client):
+    """Test upload of a file with an invalid extension."""
+    file_content = b"This is an executable file."
+    file_name = "test_app.exe"
+    data = {'file': (io.BytesIO(file_content), file_name)}
+
+    response = logged_in_client.post('/upload_file', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    json_response = response.get_json()
+    assert "File type not allowed" in json_response['error']
+    
+    file_path = agent.AGENT_FILES_WORKSPACE / file_name
+    assert not file_path.exists()
+
+def test_upload_file_too_large(logged_in_client, monkeypatch):
+    """Test upload of a file that exceeds MAX_FILE_SIZE."""
+    original_max_size = app.config.get('MAX_FILE_SIZE', 1 * 1024 * 1024 * 1024) # Default from app.py if not in config
+    
+    # Mock MAX_FILE_SIZE in the app's configuration for this test
+    # For this to work, app.py should ideally use app.config['MAX_FILE_SIZE']
+    # If app.py uses a global constant MAX_FILE_SIZE, this won't work directly.
+    # The prompt mentioned app.MAX_FILE_SIZE. Let's assume it's a direct attribute or can be monkeypatched.
+    # We are testing the route in app.py, so we need to affect *that* app instance.
+    # The `app` object imported is the actual app instance.
+    # The constants `ALLOWED_EXTENSIONS` and `MAX_FILE_SIZE` were added directly to app.py, not app.config
+    # So, we need to monkeypatch the global constant in the `app` module (which is `app.py` effectively).
+    
+    monkeypatch.setattr('app.MAX_FILE_SIZE', 10) # Set max size to 10 bytes for this test
+
+    file_content = b"This file is larger than 10 bytes."
+    file_name = "large_file.txt"
+    data = {'file': (io.BytesIO(file_content), file_name)}
+
+    response = logged_in_client.post('/upload_file', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 413
+    json_response = response.get_json()
+    assert "File exceeds maximum size" in json_response['error']
+    
+    file_path = agent.AGENT_FILES_WORKSPACE / file_name
+    assert not file_path.exists()
+    
+    # Restore original value if necessary (monkeypatch does this automatically for `setattr`)
+    # monkeypatch.undo() # Not strictly needed for setattr if monkeypatch fixture is used as arg
+
+def test_upload_too_large_keeps_existing_file(logged_in_client, monkeypatch):
+    """Test that a rejected oversized upload leaves an existing file of the same name untouched."""
+    monkeypatch.setattr('app.MAX_FILE_SIZE', 10)
+    file_path = agent.AGENT_FILES_WORKSPACE / "existing.txt"
+    file_path.write_bytes(b"keep me")
+
+    data = {'file': (io.BytesIO(b"This file is larger than 10 bytes."), "existing.txt")}
+    response = logged_in_client.post('/upload_file', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 413
+    assert file_path.read_bytes() == b"keep me"
+    assert [p.name for p in agent.AGENT_FILES_WORKSPACE.iterdir()] == ["existing.txt"]
+
+def test_upload_rejected_by_content_length(logged_in_client, monkeypatch):
+    """Test that a raw upload whose Content-Length is over the limit is refused up front."""
+    monkeypatch.setattr('app.MAX_FILE_SIZE', 10)
+    response = logged_in_client.post('/upload_file', data=b"x" * 11,
+                                     headers={'Content-Type': 'application/octet-stream', 'X-Filename': 'big.txt'})
+    assert response.status_code == 413
+    assert not (agent.AGENT_FILES_WORKSPACE / "big.txt").exists()
+
+def test_upload_raw_octet_stream(logged_in_client):
+    """Test uploading a raw application/octet-stream body named by the X-Filename header."""
+    file_content = b"Raw streamed upload body."
+    response = logged_in_client.post('/upload_file', data=file_content,
+                                     content_type='application/octet-stream',
+                                     headers={'X-Filename': 'raw_upload.txt'})
+
+    assert response.status_code == 200
+    assert response.get_json()['message'] == 'File raw_upload.txt uploaded successfully.'
+    assert _same(agent.AGENT_FILES_WORKSPACE / "raw_upload.txt", file_content)
+
+def test_upload_no_file_part(logged_in_client):
+    """Test upload request with no file part."""
+    response = logged_in_client.post('/upload_file', data={}, content_type='multipart/form-data')
+    
+    assert response.status_code == 400
+    json_response = response.get_json()
+    assert json_response['error'] == 'No file part in the request.'
+
+def test_upload_no_selected_file(logged_in_client):
+    """Test upload request with no selected file (empty filename)."""
+    data = {'file': (io.BytesIO(b""), '')} # Empty filename
+    response = logged_in_client.post('/upload_file', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    json_response = response.get_json()
+    assert json_response['error'] == 'No selected file.'
+
+def test_upload_unauthenticated(unauthenticated_client):
+    """Test upload attempt by an unauthenticated user."""
+    file_content = b"This is a test text file."
+    file_name = "test_unauth.txt"
+    data = {'file': (io.BytesIO(file_content), file_name)}
+
+    response = unauthenticated_client.post('/upload_file', data=data, content_type='multipart/form-data')
+    
+    # Flask-Login usually redirects to login_view on @login_required failure
+    assert response.status_code == 302 
+    # Check if it redirects to the login page (or a page containing '/login')
+    assert '/login' in response.headers['Location']
+
+
+def test_raw_file_streams_content(logged_in_client):
+    """Test that /raw_file returns the file bytes unmodified and honours conditional GETs."""
+    file_content = b"Raw bytes served straight from disk."
+    (agent.AGENT_FILES_WORKSPACE / "raw.txt").write_bytes(file_content)
+
+    response = logged_in_client.get('/raw_file/raw.txt')
+    assert response.status_code == 200
+    assert response.data == file_content
+    assert response.mimetype == 'text/plain'
+
+    cached = logged_in_client.get('/raw_file/raw.txt', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+def test_raw_file_never_serves_renderable_markup(logged_in_client):
+    """Test that /raw_file sends model-written HTML as plain text so it cannot run on the app's origin."""
+    (agent.AGENT_FILES_WORKSPACE / "page.html").write_bytes(b"<script>alert(1)</script>")
+
+    response = logged_in_client.get('/raw_file/page.html')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'text/plain; charset=utf-8'
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+
+def test_raw_file_missing_and_disallowed(logged_in_client):
+    """Test /raw_file error statuses for missing files and paths outside the workspace."""
+    assert logged_in_client.get('/raw_file/does_not_exist.txt').status_code == 404
+    assert logged_in_client.get('/raw_file/..%2F..%2Fetc%2Fpasswd').status_code == 400
+
+def test_view_file_streams_text_or_returns_json(logged_in_client):
+    """Test that /view_file streams plain text when preferred and keeps the JSON shape otherwise."""
+    (agent.AGENT_FILES_WORKSPACE / "view.txt").write_text("Streamed text \u00e9")
+
+    response = logged_in_client.get('/view_file/view.txt', headers={'Accept': 'text/plain'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert response.get_data(as_text=True) == "Streamed text \u00e9"
+
+    response = logged_in_client.get('/view_file/view.txt')
+    assert response.status_code == 200
+    assert response.get_json() == {'filename': 'view.txt', 'content': "Streamed text \u00e9"}
+
+    missing = logged_in_client.get('/view_file/missing.txt', headers={'Accept': 'text/plain'})
+    assert missing.status_code == 404
+    assert 'File not found' in missing.get_json()['error']
+
+    missing = logged_in_client.get('/view_file/missing.txt')
+    assert missing.status_code == 404
+    assert logged_in_client.get('/view_file/..%2F..%2Fetc%2Fpasswd').status_code == 400
+
+def test_view_file_json_reads_the_path_it_resolved(logged_in_client):
+    """Test that /view_file's JSON branch reads the path it built the ETag from instead of resolving it again."""
+    (agent.AGENT_FILES_WORKSPACE / "once.txt").write_text("Resolved once")
+    with patch('agent._resolve_safe_path', side_effect=AssertionError("resolved twice")):
+        response = logged_in_client.get('/view_file/once.txt')
+    assert response.status_code == 200
+    assert response.get_json()['content'] == "Resolved once"
+
+def test_view_file_and_list_files_answer_conditional_gets(logged_in_client):
+    """Test that unchanged files and listings are answered with 304 for a matching ETag."""
+    file_path = agent.AGENT_FILES_WORKSPACE / "etag.txt"
+    file_path.write_text("version one")
+
+    for headers in ({}, {'Accept': 'text/plain'}):
+        first = logged_in_client.get('/view_file/etag.txt', headers=headers)
+        assert first.status_code == 200
+        etag = first.headers['ETag']
+        repeat = logged_in_client.get('/view_file/etag.txt', headers={**headers, 'If-None-Match': etag})
+        assert repeat.status_code == 304
+
+    file_path.write_text("version two, longer")
+    changed = logged_in_client.get('/view_file/etag.txt', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+
+    listing = logged_in_client.get('/list_files')
+    assert listing.get_json() == {'files': ['etag.txt']}
+    assert logged_in_client.get('/list_files', headers={'If-None-Match': listing.headers['ETag']}).status_code == 304
+
+
+# --- Pytest Test Functions for /ask ---
+
+def test_ask_rejects_empty_and_malformed_bodies(logged_in_client):
+    """Test that /ask answers 400 for a missing message or invalid JSON without calling the model."""
+    with patch('app._get_model', return_value=object()), patch('app.get_gemini_response', return_value='hi') as mock_response:
+        response = logged_in_client.post('/ask', data=b'', content_type='application/json')
+        assert response.status_code == 400
+        response = logged_in_client.post('/ask', data=b'{not json', content_type='application/json')
+        assert response.status_code == 400
+        mock_response.assert_not_called()
+
+        response = logged_in_client.post('/ask', json={'message': 'hello'})
+        assert response.status_code == 200
+        assert response.json == {'reply': 'hi'}